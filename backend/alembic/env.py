@@ -0,0 +1,71 @@
+from logging.config import fileConfig
+
+from alembic import context
+from alembic.script import ScriptDirectory
+from sqlalchemy import engine_from_config, inspect, pool
+
+from app import database, models, partitioning
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+# Use the same URL resolution as the application (DATABASE_URL, postgres:// fix-up)
+config.set_main_option("sqlalchemy.url", database.db_url.replace("%", "%%"))
+
+target_metadata = models.Base.metadata
+
+
+def include_name(name, type_, parent_names):
+    # Monthly focus_sessions partitions (app/partitioning.py) are managed outside migrations
+    return not (type_ == "table" and partitioning.is_partition_name(name))
+
+
+# Tables that the app used to create with Base.metadata.create_all at startup
+LEGACY_REVISION = "0001"
+
+
+def stamp_legacy_schema(connection):
+    """
+    Databases created by the old create_all have the 0001 tables but no revision, so
+    0001 would fail with "relation users already exists". Adopt them as 0001.
+    """
+    migration_context = context.get_context()
+    if migration_context.get_current_revision() is None and inspect(connection).has_table("users"):
+        migration_context.stamp(ScriptDirectory.from_config(config), LEGACY_REVISION)
+
+
+def run_migrations_offline():
+    """Emit the migration SQL to stdout without connecting (alembic upgrade head --sql)."""
+    context.configure(
+        url=config.get_main_option("sqlalchemy.url"),
+        target_metadata=target_metadata,
+        include_name=include_name,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    connectable = engine_from_config(
+        config.get_section(config.config_ini_section, {}),
+        prefix="sqlalchemy.",
+        poolclass=pool.NullPool,
+    )
+
+    with connectable.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata, include_name=include_name)
+
+        with context.begin_transaction():
+            stamp_legacy_schema(connection)
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
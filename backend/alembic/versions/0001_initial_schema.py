@@ -0,0 +1,63 @@
+"""initial schema
+
+Matches the tables previously created by Base.metadata.create_all at startup.
+Existing databases already have them and no revision; env.py stamps those as 0001
+before upgrading, so `alembic upgrade head` works on them as is.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "users",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("username", sa.String()),
+        sa.Column("email", sa.String()),
+        sa.Column("hashed_password", sa.String()),
+    )
+    op.create_index("ix_users_username", "users", ["username"], unique=True)
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    op.create_table(
+        "categories",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String()),
+        sa.Column("color_code", sa.String()),
+        sa.Column("user_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("users.id")),
+    )
+    op.create_index("ix_categories_id", "categories", ["id"])
+    op.create_index("ix_categories_name", "categories", ["name"])
+
+    op.create_table(
+        "focus_sessions",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("user_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("users.id")),
+        sa.Column("category_id", sa.Integer(), sa.ForeignKey("categories.id"), nullable=True),
+        sa.Column("start_time", sa.DateTime()),
+        sa.Column("end_time", sa.DateTime(), nullable=True),
+        sa.Column("duration_minutes", sa.Integer()),
+        sa.Column("status", sa.String()),
+        sa.Column("note", sa.Text(), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_table("focus_sessions")
+    op.drop_index("ix_categories_name", table_name="categories")
+    op.drop_index("ix_categories_id", table_name="categories")
+    op.drop_table("categories")
+    op.drop_index("ix_users_email", table_name="users")
+    op.drop_index("ix_users_username", table_name="users")
+    op.drop_table("users")
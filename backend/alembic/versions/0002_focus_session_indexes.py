@@ -0,0 +1,54 @@
+"""focus_sessions indexes for analytics and category deletion
+
+- ix_focus_sessions_completed_user_start: partial (status = 'COMPLETED') index on
+  (user_id, start_time) that also carries duration_minutes / category_id, so the
+  analytics aggregates in app/analytics.py are answered by index-only scans.
+- ix_focus_sessions_user_start: (user_id, start_time) over all statuses for the
+  session list and the dashboard's recent sessions.
+- ix_focus_sessions_category_id: for crud.delete_user_category.
+
+Indexes are built CONCURRENTLY so the upgrade does not block writes on a large table.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_focus_sessions_completed_user_start",
+            "focus_sessions",
+            ["user_id", "start_time"],
+            postgresql_include=["duration_minutes", "category_id"],
+            postgresql_where=sa.text("status = 'COMPLETED'"),
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_focus_sessions_user_start",
+            "focus_sessions",
+            ["user_id", "start_time"],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_focus_sessions_category_id",
+            "focus_sessions",
+            ["category_id"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_focus_sessions_category_id", table_name="focus_sessions", postgresql_concurrently=True)
+        op.drop_index("ix_focus_sessions_user_start", table_name="focus_sessions", postgresql_concurrently=True)
+        op.drop_index("ix_focus_sessions_completed_user_start", table_name="focus_sessions", postgresql_concurrently=True)
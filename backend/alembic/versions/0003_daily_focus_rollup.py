@@ -0,0 +1,51 @@
+"""daily_focus_rollup table, backfilled from focus_sessions
+
+Per user / category / day totals of COMPLETED sessions, kept up to date by crud
+(see app/rollup.py). `python -m app.rollup rebuild` recomputes it at any time.
+
+Requires PostgreSQL 15+ (NULLS NOT DISTINCT on the upsert key).
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "daily_focus_rollup",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("category_id", sa.Integer(), sa.ForeignKey("categories.id"), nullable=True),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("session_count", sa.Integer(), nullable=False),
+        sa.Column("total_minutes", sa.Integer(), nullable=False),
+    )
+    op.create_index(
+        "ux_daily_focus_rollup_user_day_category",
+        "daily_focus_rollup",
+        ["user_id", "day", "category_id"],
+        unique=True,
+        postgresql_nulls_not_distinct=True,
+    )
+    op.execute(
+        "INSERT INTO daily_focus_rollup (user_id, category_id, day, session_count, total_minutes) "
+        "SELECT user_id, category_id, date(start_time), count(id), coalesce(sum(duration_minutes), 0) "
+        "FROM focus_sessions "
+        "WHERE status = 'COMPLETED' AND start_time IS NOT NULL "
+        "GROUP BY user_id, category_id, date(start_time)"
+    )
+
+
+def downgrade():
+    op.drop_index("ux_daily_focus_rollup_user_day_category", table_name="daily_focus_rollup")
+    op.drop_table("daily_focus_rollup")
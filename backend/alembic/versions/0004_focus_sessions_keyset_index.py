@@ -0,0 +1,39 @@
+"""keyset index for cursor pagination of focus_sessions
+
+Replaces (user_id, start_time) with (user_id, start_time, id), the sort key of
+crud.get_focus_sessions_page, so every page is a bounded index range scan.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_focus_sessions_user_start_id",
+            "focus_sessions",
+            ["user_id", "start_time", "id"],
+            postgresql_concurrently=True,
+        )
+        op.drop_index("ix_focus_sessions_user_start", table_name="focus_sessions", postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_focus_sessions_user_start",
+            "focus_sessions",
+            ["user_id", "start_time"],
+            postgresql_concurrently=True,
+        )
+        op.drop_index("ix_focus_sessions_user_start_id", table_name="focus_sessions", postgresql_concurrently=True)
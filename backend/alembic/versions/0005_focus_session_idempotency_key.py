@@ -0,0 +1,33 @@
+"""idempotency_key on focus_sessions for batch ingest
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("focus_sessions", sa.Column("idempotency_key", sa.String(), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ux_focus_sessions_user_idempotency_key",
+            "focus_sessions",
+            ["user_id", "idempotency_key"],
+            unique=True,
+            postgresql_where=sa.text("idempotency_key IS NOT NULL"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index("ux_focus_sessions_user_idempotency_key", table_name="focus_sessions", postgresql_concurrently=True)
+    op.drop_column("focus_sessions", "idempotency_key")
@@ -0,0 +1,88 @@
+"""focus_session_archive table; start_time NOT NULL and part of the idempotency key
+
+Prepares focus_sessions for optional monthly range partitioning on start_time
+(`python -m app.partitioning enable`, see app/partitioning.py): the partition key
+must be NOT NULL to be part of the primary key, and every unique index of a
+partitioned table must contain it. focus_session_archive keeps the daily totals of
+partitions that are archived away.
+
+Sessions without a start_time (none are written by the API) get their end_time, or
+the migration time, and are added to daily_focus_rollup in the same statement.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "focus_session_archive",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("category_id", sa.Integer(), sa.ForeignKey("categories.id"), nullable=True),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("session_count", sa.Integer(), nullable=False),
+        sa.Column("total_minutes", sa.Integer(), nullable=False),
+    )
+    op.create_index(
+        "ux_focus_session_archive_user_day_category",
+        "focus_session_archive",
+        ["user_id", "day", "category_id"],
+        unique=True,
+        postgresql_nulls_not_distinct=True,
+    )
+
+    op.execute(
+        "WITH filled AS ("
+        "  UPDATE focus_sessions SET start_time = coalesce(end_time, now() AT TIME ZONE 'utc') WHERE start_time IS NULL"
+        "  RETURNING user_id, category_id, start_time, duration_minutes, status"
+        ") "
+        "INSERT INTO daily_focus_rollup (user_id, category_id, day, session_count, total_minutes) "
+        "SELECT user_id, category_id, date(start_time), count(*), coalesce(sum(duration_minutes), 0) "
+        "FROM filled WHERE status = 'COMPLETED' GROUP BY user_id, category_id, date(start_time) "
+        "ON CONFLICT (user_id, day, category_id) DO UPDATE SET "
+        "session_count = daily_focus_rollup.session_count + excluded.session_count, "
+        "total_minutes = daily_focus_rollup.total_minutes + excluded.total_minutes"
+    )
+    op.alter_column("focus_sessions", "start_time", existing_type=sa.DateTime(), nullable=False)
+
+    # Build the new key index before dropping the old one so batch retries stay deduplicated throughout
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ux_focus_sessions_user_idempotency_key_start",
+            "focus_sessions",
+            ["user_id", "idempotency_key", "start_time"],
+            unique=True,
+            postgresql_where=sa.text("idempotency_key IS NOT NULL"),
+            postgresql_concurrently=True,
+        )
+        op.drop_index("ux_focus_sessions_user_idempotency_key", table_name="focus_sessions", postgresql_concurrently=True)
+    op.execute("ALTER INDEX ux_focus_sessions_user_idempotency_key_start RENAME TO ux_focus_sessions_user_idempotency_key")
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ux_focus_sessions_user_idempotency_key_old",
+            "focus_sessions",
+            ["user_id", "idempotency_key"],
+            unique=True,
+            postgresql_where=sa.text("idempotency_key IS NOT NULL"),
+            postgresql_concurrently=True,
+        )
+        op.drop_index("ux_focus_sessions_user_idempotency_key", table_name="focus_sessions", postgresql_concurrently=True)
+    op.execute("ALTER INDEX ux_focus_sessions_user_idempotency_key_old RENAME TO ux_focus_sessions_user_idempotency_key")
+
+    op.alter_column("focus_sessions", "start_time", existing_type=sa.DateTime(), nullable=True)
+    op.drop_index("ux_focus_session_archive_user_day_category", table_name="focus_session_archive")
+    op.drop_table("focus_session_archive")
@@ -0,0 +1,79 @@
+"""change versions and tombstones for GET /sync
+
+- focus_sessions.version / categories.version: id of the transaction that last wrote
+  the row (pg_current_xact_id()). Existing rows get 0, which only a full sync reads,
+  so adding the columns does not rewrite either table.
+- sync_tombstones: deleted categories (and sessions) per user.
+- (user_id, version[, id]) indexes for the range reads. focus_sessions' is built
+  CONCURRENTLY; when the table is partitioned (app/partitioning.py) it is created on
+  the parent only and each partition's index is built concurrently and attached.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+CHANGE_VERSION = sa.text("pg_current_xact_id()::text::bigint")
+
+
+def _add_version(table):
+    op.add_column(table, sa.Column("version", sa.BigInteger(), nullable=False, server_default="0"))
+    op.alter_column(table, "version", server_default=CHANGE_VERSION)
+
+
+def _create_index_concurrently(name, table, columns):
+    bind = op.get_bind()
+    partitions = bind.execute(sa.text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:table) ORDER BY c.relname"
+    ), {"table": table}).scalars().all()
+    partitioned = bind.execute(sa.text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table))"
+    ), {"table": table}).scalar()
+    if not partitioned:
+        op.create_index(name, table, columns, postgresql_concurrently=True)
+        return
+
+    # CREATE INDEX CONCURRENTLY is not supported on a partitioned table: the parent's
+    # index stays invalid until every partition's index is attached
+    column_list = ", ".join(columns)
+    op.execute(f"CREATE INDEX {name} ON ONLY {table} ({column_list})")
+    for partition in partitions:
+        child = f"{name}_{partition.rsplit('_', 1)[-1]}"
+        op.execute(f"CREATE INDEX CONCURRENTLY {child} ON {partition} ({column_list})")
+        op.execute(f"ALTER INDEX {name} ATTACH PARTITION {child}")
+
+
+def upgrade():
+    _add_version("focus_sessions")
+    _add_version("categories")
+    op.create_table(
+        "sync_tombstones",
+        sa.Column("id", sa.BigInteger(), primary_key=True),
+        sa.Column("user_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("entity", sa.String(), nullable=False),
+        sa.Column("entity_id", sa.String(), nullable=False),
+        sa.Column("version", sa.BigInteger(), nullable=False, server_default=CHANGE_VERSION),
+    )
+    op.create_index("ix_sync_tombstones_user_version", "sync_tombstones", ["user_id", "version"])
+    op.create_index("ix_categories_user_version", "categories", ["user_id", "version"])
+    with op.get_context().autocommit_block():
+        _create_index_concurrently("ix_focus_sessions_user_version_id", "focus_sessions", ["user_id", "version", "id"])
+
+
+def downgrade():
+    op.drop_index("ix_focus_sessions_user_version_id", table_name="focus_sessions")
+    op.drop_index("ix_categories_user_version", table_name="categories")
+    op.drop_index("ix_sync_tombstones_user_version", table_name="sync_tombstones")
+    op.drop_table("sync_tombstones")
+    op.drop_column("categories", "version")
+    op.drop_column("focus_sessions", "version")
@@ -0,0 +1,44 @@
+"""weekly_reports and weekly_report_chunks for the batch report job (app/reports.py)
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "weekly_reports",
+        sa.Column("user_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("week_start", sa.Date(), primary_key=True),
+        sa.Column("total_minutes", sa.Integer(), nullable=False),
+        sa.Column("session_count", sa.Integer(), nullable=False),
+        sa.Column("minutes_delta", sa.Integer(), nullable=False),
+        sa.Column("sessions_delta", sa.Integer(), nullable=False),
+        sa.Column("weekday_minutes", postgresql.ARRAY(sa.Integer()), nullable=False),
+        sa.Column("categories", postgresql.JSONB(), nullable=False),
+        sa.Column("generated_at", sa.DateTime(), nullable=False),
+    )
+    op.create_table(
+        "weekly_report_chunks",
+        sa.Column("week_start", sa.Date(), primary_key=True),
+        sa.Column("chunk", sa.Integer(), primary_key=True),
+        sa.Column("first_user_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("last_user_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("done_at", sa.DateTime(), nullable=True),
+        sa.Column("reports", sa.Integer(), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_table("weekly_report_chunks")
+    op.drop_table("weekly_reports")
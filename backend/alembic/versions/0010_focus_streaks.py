@@ -0,0 +1,68 @@
+"""focus_streaks table, backfilled from daily_focus_rollup
+
+Current and longest runs of consecutive days with COMPLETED sessions, per user
+(category_id NULL) and per category, kept up to date by crud (see app/streaks.py).
+`python -m app.streaks rebuild` recomputes them at any time.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "focus_streaks",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("category_id", sa.Integer(), sa.ForeignKey("categories.id"), nullable=True),
+        sa.Column("last_day", sa.Date(), nullable=True),
+        sa.Column("current_length", sa.Integer(), nullable=False),
+        sa.Column("longest_length", sa.Integer(), nullable=False),
+        sa.Column("longest_end", sa.Date(), nullable=True),
+    )
+    op.create_index(
+        "ux_focus_streaks_user_category",
+        "focus_streaks",
+        ["user_id", "category_id"],
+        unique=True,
+        postgresql_nulls_not_distinct=True,
+    )
+    # Gaps and islands: consecutive days share day - row_number(), so each group is one run
+    op.execute(
+        "INSERT INTO focus_streaks (user_id, category_id, last_day, current_length, longest_length, longest_end) "
+        "WITH active AS ("
+        "  SELECT user_id, category_id, day FROM daily_focus_rollup "
+        "  WHERE category_id IS NOT NULL AND session_count > 0 "
+        "  UNION ALL "
+        "  SELECT user_id, NULL::integer, day FROM daily_focus_rollup "
+        "  WHERE session_count > 0 GROUP BY user_id, day"
+        "), runs AS ("
+        "  SELECT user_id, category_id, max(day) AS run_end, count(*)::integer AS length FROM ("
+        "    SELECT *, day - (row_number() OVER (PARTITION BY user_id, category_id ORDER BY day))::integer AS island "
+        "    FROM active"
+        "  ) numbered GROUP BY user_id, category_id, island"
+        "), ranked AS ("
+        "  SELECT *, "
+        "    row_number() OVER (PARTITION BY user_id, category_id ORDER BY run_end DESC) AS latest, "
+        "    row_number() OVER (PARTITION BY user_id, category_id ORDER BY length DESC, run_end DESC) AS best "
+        "  FROM runs"
+        ") "
+        "SELECT user_id, category_id, max(run_end), "
+        "  max(length) FILTER (WHERE latest = 1), max(length), max(run_end) FILTER (WHERE best = 1) "
+        "FROM ranked GROUP BY user_id, category_id"
+    )
+
+
+def downgrade():
+    op.drop_index("ux_focus_streaks_user_category", table_name="focus_streaks")
+    op.drop_table("focus_streaks")
@@ -0,0 +1,45 @@
+"""weekly_report_chunks: contiguous, open-ended id ranges
+
+A chunk now covers [first_user_id, end_user_id): from the first id of its range up to
+the first id of the next one, with NULL for the open ends of the first and last
+chunk. Users created after the plan fall into a chunk instead of between two.
+Existing plans are converted in place.
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "0011"
+down_revision = "0010"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("weekly_report_chunks", sa.Column("end_user_id", postgresql.UUID(as_uuid=True), nullable=True))
+    op.alter_column("weekly_report_chunks", "first_user_id", nullable=True)
+    op.execute(
+        "UPDATE weekly_report_chunks c SET "
+        "  first_user_id = CASE WHEN n.is_first THEN NULL ELSE c.first_user_id END, "
+        "  end_user_id = n.next_first "
+        "FROM ("
+        "  SELECT week_start, chunk, "
+        "    lead(first_user_id) OVER (PARTITION BY week_start ORDER BY chunk) AS next_first, "
+        "    row_number() OVER (PARTITION BY week_start ORDER BY chunk) = 1 AS is_first "
+        "  FROM weekly_report_chunks"
+        ") n WHERE n.week_start = c.week_start AND n.chunk = c.chunk"
+    )
+    op.drop_column("weekly_report_chunks", "last_user_id")
+
+
+def downgrade():
+    # Plans only: the next run of a week plans it again (the reports themselves stay)
+    op.execute("DELETE FROM weekly_report_chunks")
+    op.drop_column("weekly_report_chunks", "end_user_id")
+    op.add_column("weekly_report_chunks", sa.Column("last_user_id", postgresql.UUID(as_uuid=True), nullable=False))
+    op.alter_column("weekly_report_chunks", "first_user_id", nullable=False)
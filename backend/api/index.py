@@ -1,7 +1,15 @@
 import sys
 import os
 
+# Serverless entry point. Nothing here runs migrations (the Docker image runs them before
+# uvicorn): run `alembic upgrade head` from backend/ as a deploy step before switching
+# traffic. GET /health/ready stays 503 until the database is at the head revision.
+
 # Add the parent directory (backend) to sys.path so we can import app
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# Short-lived instances: NullPool engines, and live timers without LISTEN (LIVE_FANOUT=local).
+# Must be set before app.database is imported; an explicit DB_PROFILE still wins.
+os.environ.setdefault("DB_PROFILE", "serverless")
+
 from app.main import app
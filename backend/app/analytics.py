@@ -1,8 +1,80 @@
+import base64
+import os
+import struct
+
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime, timedelta
+from sqlalchemy import Date, DateTime, Integer, cast, func, literal, literal_column, select
+from sqlalchemy.dialects.postgresql import JSON, aggregate_order_by
+from datetime import date, datetime, timedelta
+from uuid import UUID
 from . import models
 
+# Aggregates come from the incrementally maintained rollup (see rollup.py)
+Rollup = models.DailyFocusRollup
+Streak = models.FocusStreak
+
+GRANULARITIES = ("day", "week", "month")
+# Largest number of buckets one series may return (about ten years of days)
+SERIES_MAX_POINTS = int(os.getenv("ANALYTICS_SERIES_MAX_POINTS", "3700"))
+
+def _bucket_start(day: date, granularity: str):
+    # Same buckets as Postgres date_trunc: ISO weeks start on Monday
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+def series_points(start: date, end: date, granularity: str):
+    """How many buckets get_series returns for the range."""
+    first, last = _bucket_start(start, granularity), _bucket_start(end, granularity)
+    if granularity == "month":
+        return (last.year - first.year) * 12 + last.month - first.month + 1
+    return (last - first).days // (7 if granularity == "week" else 1) + 1
+
+def series_query(user_id: str, start: date, end: date, granularity: str = "day", category_id: int = None):
+    """
+    Per-bucket (date, count, minutes) of COMPLETED sessions from start to end
+    (inclusive), one row per bucket in order, empty buckets as 0. A bucket is
+    labelled with its first day (Monday for weeks), which may fall before start;
+    only days inside the range are counted.
+
+    One grouped range scan of the rollup, left-joined onto generate_series, so the
+    gaps are filled in the database whatever the length of the range.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+
+    def trunc(value):
+        # Cast to timestamp first: date_trunc on a date would use timestamptz and the session time zone
+        return func.date_trunc(granularity, cast(value, DateTime))
+
+    filters = [Rollup.user_id == user_id, Rollup.day >= start, Rollup.day <= end]
+    if category_id:
+        filters.append(Rollup.category_id == category_id)
+    bucket = cast(trunc(Rollup.day), Date)
+    totals = select(
+        bucket.label("bucket"),
+        func.sum(Rollup.session_count).label("count"),
+        func.sum(Rollup.total_minutes).label("minutes")
+    ).where(*filters).group_by(bucket).subquery("totals")
+
+    buckets = func.generate_series(
+        trunc(literal(start, Date)), trunc(literal(end, Date)), literal_column(f"interval '1 {granularity}'")
+    ).table_valued("bucket").render_derived(name="buckets")
+    day = cast(buckets.c.bucket, Date)
+    return select(
+        day.label("date"),
+        cast(func.coalesce(totals.c.count, 0), Integer).label("count"),
+        cast(func.coalesce(totals.c.minutes, 0), Integer).label("minutes")
+    ).select_from(
+        buckets.outerjoin(totals, totals.c.bucket == day)
+    ).order_by(day)
+
+def get_series(db: Session, user_id: str, start: date, end: date, granularity: str = "day", category_id: int = None):
+    """[(bucket date, session count, minutes)] for every bucket of the range; see series_query."""
+    return db.execute(series_query(user_id, start, end, granularity, category_id)).all()
+
 def get_daily_stats(db: Session, user_id: str, category_id: int = None):
     """
     Get statistics for the current day (UTC).
@@ -10,25 +82,8 @@ def get_daily_stats(db: Session, user_id: str, category_id: int = None):
         total_focus_time (int): Total minutes of focus today.
         session_count (int): Number of completed sessions today.
     """
-    today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    query = db.query(
-        func.sum(models.FocusSession.duration_minutes),
-        func.count(models.FocusSession.id)
-    ).filter(
-        models.FocusSession.user_id == user_id,
-        models.FocusSession.start_time >= today_start,
-        models.FocusSession.status == "COMPLETED"
-    )
-    
-    if category_id:
-        query = query.filter(models.FocusSession.category_id == category_id)
-        
-    stats = query.first()
-
-    total_minutes = stats[0] if stats[0] else 0
-    count = stats[1] if stats[1] else 0
-    
+    today = datetime.utcnow().date()
+    [(_, count, total_minutes)] = get_series(db, user_id, today, today, "day", category_id)
     return {
         "total_focus_minutes": total_minutes,
         "session_count": count
@@ -38,92 +93,29 @@ def get_weekly_stats(db: Session, user_id: str, category_id: int = None):
     """
     Get daily focus time for the last 7 days.
     """
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=6)
-    start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    today = datetime.utcnow().date()
+    return _weekly(get_series(db, user_id, today - timedelta(days=6), today, "day", category_id))
 
-    query = db.query(
-        func.date(models.FocusSession.start_time).label("date"),
-        func.sum(models.FocusSession.duration_minutes).label("minutes")
-    ).filter(
-        models.FocusSession.user_id == user_id,
-        models.FocusSession.start_time >= start_date,
-        models.FocusSession.status == "COMPLETED"
-    )
-    
-    if category_id:
-        query = query.filter(models.FocusSession.category_id == category_id)
-        
-    sessions = query.group_by(
-        func.date(models.FocusSession.start_time)
-    ).all()
-
-    # Create a dict for easy lookup
-    data_map = {str(r.date): r.minutes for r in sessions}
-
-    # Fill in ease of the last 7 days with 0 if no data
-    result = []
-    current = start_date
-    for _ in range(7):
-        date_str = current.strftime("%Y-%m-%d")
-        result.append({
-            "date": date_str,
-            "minutes": data_map.get(date_str, 0)
-        })
-        current += timedelta(days=1)
-        
-    return result
+def _weekly(days):
+    # str(): dates from get_series, or the ISO strings of the dashboard's JSON
+    return [{"date": str(day), "minutes": minutes} for day, _, minutes in days]
 
 def get_heatmap_data(db: Session, user_id: str, category_id: int = None):
     """
     Get daily session counts for the activity heatmap (last 365 days).
     Format: [{ date: "YYYY-MM-DD", count: 5, level: 1-4 }]
     """
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=365)
-    
-    query = db.query(
-        func.date(models.FocusSession.start_time).label("date"),
-        func.count(models.FocusSession.id).label("count")
-    ).filter(
-        models.FocusSession.user_id == user_id,
-        models.FocusSession.start_time >= start_date,
-        models.FocusSession.status == "COMPLETED"
-    )
-    
-    if category_id:
-        query = query.filter(models.FocusSession.category_id == category_id)
-        
-    sessions = query.group_by(
-        func.date(models.FocusSession.start_time)
-    ).all()
-    
-    
-    result = []
-    # Create a map of date string to count
-    stats_map = {str(r.date): r.count for r in sessions}
-
-    # Generate entries for every day in the last 365 days
-    current_date = start_date
-    while current_date <= end_date:
-        date_str = current_date.strftime("%Y-%m-%d")
-        count = stats_map.get(date_str, 0)
-        
-        # Simple level calculation logic
-        if count == 0: level = 0
-        elif count <= 2: level = 1
-        elif count <= 4: level = 2
-        elif count <= 6: level = 3
-        else: level = 4
-        
-        result.append({
-            "date": date_str,
-            "count": count,
-            "level": level
-        })
-        current_date += timedelta(days=1)
-        
-    return result
+    today = datetime.utcnow().date()
+    return _heatmap(get_series(db, user_id, today - timedelta(days=365), today, "day", category_id))
+
+def _heatmap(days):
+    return [{"date": str(day), "count": count, "level": _heatmap_level(count)} for day, count, _ in days]
+
+# Heatmap level by session count: 0, 1-2, 3-4, 5-6, 7+
+_LEVELS = (0, 1, 1, 2, 2, 3, 3)
+
+def _heatmap_level(count):
+    return _LEVELS[count] if count < len(_LEVELS) else 4
 
 def get_category_distribution(db: Session, user_id: str, category_id: int = None):
     """
@@ -134,16 +126,15 @@ def get_category_distribution(db: Session, user_id: str, category_id: int = None
     query = db.query(
         models.Category.name,
         models.Category.color_code,
-        func.sum(models.FocusSession.duration_minutes).label("total_minutes")
+        func.sum(Rollup.total_minutes).label("total_minutes")
     ).join(
-        models.FocusSession, models.FocusSession.category_id == models.Category.id
+        Rollup, Rollup.category_id == models.Category.id
     ).filter(
-        models.FocusSession.user_id == user_id,
-        models.FocusSession.status == "COMPLETED"
+        Rollup.user_id == user_id
     )
     
     if category_id:
-        query = query.filter(models.FocusSession.category_id == category_id)
+        query = query.filter(Rollup.category_id == category_id)
 
     results = query.group_by(
         models.Category.id, models.Category.name, models.Category.color_code
@@ -158,3 +149,161 @@ def get_category_distribution(db: Session, user_id: str, category_id: int = None
         })
         
     return data
+
+def get_dashboard_data(db: Session, user_id: str, category_id: int = None):
+    """
+    Everything /analytics/dashboard needs, fetched in one database round trip.
+    Same result as calling get_daily_stats, get_weekly_stats, get_heatmap_data,
+    get_category_distribution and crud.get_focus_sessions(limit=5) one after another,
+    plus the current and longest streak (focus_streaks, see streaks.py).
+
+    The daily series of the last 366 days (series_query, gaps already filled) feeds
+    the daily, weekly and heatmap blocks; the lifetime distribution and the recent
+    sessions are folded into the same statement as CTEs and returned as JSON columns.
+    """
+    now, row = _dashboard_row(db, user_id, category_id)
+    days = row.days
+
+    return {
+        "daily_stats": _daily_totals(days, now.date().isoformat()),
+        "weekly_stats": _weekly(days[-7:]),
+        "heatmap_data": _heatmap(days),
+        "category_distribution": [
+            {"name": name, "value": value, "color": color}
+            for name, color, value in (row.distribution or [])
+        ],
+        "recent_sessions": [_recent_session(r) for r in (row.recent or [])],
+        "streaks": _streaks(row.streak, now.date())
+    }
+
+def get_dashboard_compact(db: Session, user_id: str, category_id: int = None, packed: bool = False):
+    """
+    Same data as get_dashboard_data in a columnar shape: each series is its start
+    date plus parallel integer arrays (index i is start + i days) instead of one
+    object per day, and the distribution is three parallel arrays.
+    {
+        "daily_stats": { total_focus_minutes, session_count },
+        "weekly_stats": { start: "YYYY-MM-DD", minutes: [7 ints] },
+        "heatmap_data": { start: "YYYY-MM-DD", counts: [366 ints], levels: [366 ints] },
+        "category_distribution": { names: [...], values: [...], colors: [...] },
+        "recent_sessions": [...],
+        "streaks": { current, longest }
+    }
+    With packed=True every integer array is sent as base64 of little-endian
+    uint32 values, and the payload carries "encoding": "base64-uint32le".
+    """
+    now, row = _dashboard_row(db, user_id, category_id)
+    today = now.date()
+    week_start = today - timedelta(days=6)
+    heatmap_start = today - timedelta(days=365)
+
+    days = row.days
+    weekly = [minutes for _, _, minutes in days[-7:]]
+    counts = [count for _, count, _ in days]
+    levels = [_heatmap_level(count) for count in counts]
+    distribution = row.distribution or []
+
+    encode = _pack if packed else list
+    data = {
+        "daily_stats": _daily_totals(days, today.isoformat()),
+        "weekly_stats": {"start": week_start.isoformat(), "minutes": encode(weekly)},
+        "heatmap_data": {"start": heatmap_start.isoformat(), "counts": encode(counts), "levels": encode(levels)},
+        "category_distribution": {
+            "names": [name for name, _, _ in distribution],
+            "values": encode([value for _, _, value in distribution]),
+            "colors": [color for _, color, _ in distribution]
+        },
+        "recent_sessions": [_recent_session(r) for r in (row.recent or [])],
+        "streaks": _streaks(row.streak, today)
+    }
+    if packed:
+        data["encoding"] = "base64-uint32le"
+    return data
+
+def _pack(values):
+    return base64.b64encode(struct.pack(f"<{len(values)}I", *values)).decode("ascii")
+
+def _daily_totals(days, today_str):
+    today = [(count, minutes) for date_str, count, minutes in days if date_str >= today_str]
+    return {
+        "total_focus_minutes": sum(minutes or 0 for _, minutes in today),
+        "session_count": sum(count for count, _ in today)
+    }
+
+def _dashboard_row(db: Session, user_id: str, category_id: int = None):
+    # One statement: daily series of the last 366 days, lifetime distribution, 5 most recent sessions, streak
+    now = datetime.utcnow()
+    today = now.date()
+
+    fs = models.FocusSession
+    user_filter = [fs.user_id == user_id]
+    rollup_filter = [Rollup.user_id == user_id]
+    if category_id:
+        user_filter.append(fs.category_id == category_id)
+        rollup_filter.append(Rollup.category_id == category_id)
+
+    per_day = series_query(user_id, today - timedelta(days=365), today, "day", category_id).cte("per_day")
+
+    distribution = select(
+        models.Category.name,
+        models.Category.color_code,
+        func.sum(Rollup.total_minutes).label("total_minutes")
+    ).join(
+        Rollup, Rollup.category_id == models.Category.id
+    ).where(
+        *rollup_filter
+    ).group_by(
+        models.Category.id, models.Category.name, models.Category.color_code
+    ).cte("distribution")
+
+    recent = select(
+        fs.id, fs.user_id, fs.category_id, fs.start_time, fs.end_time,
+        fs.duration_minutes, fs.status, fs.note
+    ).where(
+        *user_filter
+    ).order_by(fs.start_time.desc(), fs.id.desc()).limit(5).cte("recent")
+
+    # Maintained by streaks.py: one row for the user (or the filtered category)
+    streak = select(
+        func.json_build_array(Streak.last_day, Streak.current_length, Streak.longest_length, type_=JSON)
+    ).where(Streak.user_id == user_id, Streak.category_id.is_not_distinct_from(category_id or None))
+
+    row = db.execute(select(
+        select(func.json_agg(
+            aggregate_order_by(
+                func.json_build_array(per_day.c.date, per_day.c.count, per_day.c.minutes), per_day.c.date
+            ), type_=JSON
+        )).scalar_subquery().label("days"),
+        select(func.json_agg(
+            func.json_build_array(distribution.c.name, distribution.c.color_code, distribution.c.total_minutes), type_=JSON
+        )).scalar_subquery().label("distribution"),
+        select(func.json_agg(
+            aggregate_order_by(
+                func.json_build_object(*[arg for c in recent.c for arg in (literal_column(f"'{c.name}'"), c)]),
+                recent.c.start_time.desc(), recent.c.id.desc()
+            ), type_=JSON
+        )).scalar_subquery().label("recent"),
+        streak.scalar_subquery().label("streak"),
+    )).one()
+
+    return now, row
+
+def _streaks(streak, today):
+    # A run is still current while its last day is today or yesterday
+    last_day, current, longest = streak or (None, 0, 0)
+    if last_day is None or date.fromisoformat(last_day) < today - timedelta(days=1):
+        current = 0
+    return {"current": current, "longest": longest}
+
+def _recent_session(r):
+    # Same field types as the ORM objects returned by crud.get_focus_sessions
+    return {
+        "id": UUID(r["id"]),
+        "user_id": UUID(r["user_id"]),
+        "category_id": r["category_id"],
+        "start_time": datetime.fromisoformat(r["start_time"]) if r["start_time"] else None,
+        "end_time": datetime.fromisoformat(r["end_time"]) if r["end_time"] else None,
+        "duration_minutes": r["duration_minutes"],
+        "status": r["status"],
+        "note": r["note"]
+    }
@@ -1,11 +1,14 @@
 from datetime import datetime, timedelta
 from typing import Optional
+import hashlib
+import time
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from . import schemas, database, models
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
+from . import schemas, database, models, cache, hashing
 import os
 
 # Secret key for JWT encoding/decoding
@@ -14,14 +17,31 @@ SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30 * 24 * 60 # 30 days for MVP convenience
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# EventSource cannot send an Authorization header, so GET /live/stream takes ?ticket=:
+# a token that only opens streams and expires within seconds, so a URL that ends up
+# in an access log is of no use. POST /live/stream-ticket issues them.
+STREAM_TICKET_SCOPE = "live-stream"
+STREAM_TICKET_EXPIRE_SECONDS = int(os.getenv("STREAM_TICKET_EXPIRE_SECONDS", "60"))
+
+# Verified identity cache: token -> user identity, so repeat requests with the same
+# token skip JWT verification and the user lookup. Per worker; entries live at most
+# IDENTITY_CACHE_TTL seconds and never past the token's own expiry. A change to a user
+# row only invalidates the worker that made it: the other workers keep accepting the
+# old identity (a deleted user, a renamed username) for up to IDENTITY_CACHE_TTL seconds,
+# so lower it, or run one worker, where that window matters.
+IDENTITY_CACHE_TTL = int(os.getenv("IDENTITY_CACHE_TTL", "300"))
+IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", "10000"))
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
+# Same CryptContext as the bcrypt worker pool (BCRYPT_ROUNDS). Request handlers should
+# use the async hashing.hash_password / hashing.verify_and_update instead of these.
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return hashing.get_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return hashing.get_context().hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -33,22 +53,108 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
-    credentials_exception = HTTPException(
+def create_stream_ticket(username: str):
+    return create_access_token(
+        {"sub": username, "scope": STREAM_TICKET_SCOPE}, timedelta(seconds=STREAM_TICKET_EXPIRE_SECONDS)
+    )
+
+_identity_cache = cache.InMemoryCache(max_entries=IDENTITY_CACHE_SIZE)
+_identity_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+def _token_key(token: str):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def invalidate_user_identity(user_id=None):
+    """Drop cached identities of one user (or of everyone when user_id is None)."""
+    dropped = _identity_cache.discard_where(lambda identity: user_id is None or identity["id"] == user_id)
+    _identity_stats["invalidations"] += dropped
+
+def identity_cache_stats():
+    lookups = _identity_stats["hits"] + _identity_stats["misses"]
+    return {
+        **_identity_stats,
+        "size": len(_identity_cache),
+        "hit_ratio": _identity_stats["hits"] / lookups if lookups else 0.0,
+    }
+
+# Any ORM change to a user row invalidates their cached identities once it is committed:
+# dropping them at flush would let a concurrent request cache the old row again before the commit.
+# Bulk query().update()/delete() bypass these events: call invalidate_user_identity directly, after commit.
+_CHANGED_USERS = "flowstate_changed_user_ids"
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _user_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is None:
+        invalidate_user_identity(target.id)
+    else:
+        session.info.setdefault(_CHANGED_USERS, set()).add(target.id)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session):
+    for user_id in session.info.pop(_CHANGED_USERS, ()):
+        invalidate_user_identity(user_id)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_users(session):
+    session.info.pop(_CHANGED_USERS, None)
+
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_async_db)):
+    credentials_exception = _credentials_exception()
+    key = _token_key(token)
+    identity = _identity_cache.get(key)
+    if identity is not None:
+        _identity_stats["hits"] += 1
+        # Detached snapshot: enough for the routes (id, username, email), never added to a session
+        return models.User(**identity)
+    _identity_stats["misses"] += 1
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
-        if username is None:
+        if username is None or payload.get("scope") is not None:  # stream tickets only open streams
             raise credentials_exception
         token_data = schemas.TokenData(username=username)
     except JWTError:
         raise credentials_exception
     
-    user = db.query(models.User).filter(models.User.username == token_data.username).first()
+    result = await db.execute(select(models.User).where(models.User.username == token_data.username))
+    user = result.scalars().first()
     if user is None:
         raise credentials_exception
+
+    ttl = min(IDENTITY_CACHE_TTL, payload.get("exp", 0) - time.time())
+    if ttl > 0:
+        _identity_cache.set(key, {"id": user.id, "username": user.username, "email": user.email}, ttl)
+    return user
+
+async def get_stream_user(token: Optional[str] = Depends(optional_oauth2_scheme), ticket: Optional[str] = None, db: AsyncSession = Depends(database.get_async_db)):
+    # A bearer token in the header, or a stream ticket in the query (see STREAM_TICKET_SCOPE)
+    if token:
+        return await get_current_user(token, db)
+    if not ticket:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    try:
+        payload = jwt.decode(ticket, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise _credentials_exception()
+    if payload.get("scope") != STREAM_TICKET_SCOPE or payload.get("sub") is None:
+        raise _credentials_exception()
+    # Not cached: a ticket opens one stream
+    result = await db.execute(select(models.User).where(models.User.username == payload["sub"]))
+    user = result.scalars().first()
+    if user is None:
+        raise _credentials_exception()
     return user
@@ -0,0 +1,210 @@
+"""
+Response cache for the analytics dashboard.
+
+Entries hold the serialized response body and its strong ETag, keyed by user,
+category filter, wire format and UTC day; the gzip form of a body is cached
+alongside it so hits are not recompressed. Writes in crud.py call invalidate_user, which bumps a
+per-user generation number that is part of every key, so invalidation is a single
+operation on any backend and never races with a response being computed (the
+generation is read before the data).
+
+The backend is chosen with CACHE_URL:
+    (unset)              in-process LRU, one per worker
+    redis://host:6379/0  shared by all workers (requires the redis package)
+"""
+import gzip
+import hashlib
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+
+CACHE_URL = os.getenv("CACHE_URL")
+DASHBOARD_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", "60"))  # seconds
+DASHBOARD_CACHE_SIZE = int(os.getenv("DASHBOARD_CACHE_SIZE", "1024"))  # entries per worker (in-process backend)
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1000"))  # bytes; smaller responses are sent uncompressed
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+
+
+class CacheBackend(ABC):
+    """Storage interface. Values are bytes; counters are integers that never go back."""
+
+    @abstractmethod
+    def get(self, key: str):
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl: int):
+        ...
+
+    @abstractmethod
+    def counter(self, key: str) -> int:
+        ...
+
+    @abstractmethod
+    def incr(self, key: str) -> int:
+        ...
+
+
+class InMemoryCache(CacheBackend):
+    """
+    Thread-safe LRU with per-entry TTL. Counters are bounded by the same LRU size; an
+    evicted counter comes back at the highest value evicted so far, so it never
+    returns to a generation that older entries were cached under.
+    """
+
+    def __init__(self, max_entries: int = DASHBOARD_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._counters = OrderedDict()
+        self._counter_floor = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def counter(self, key):
+        with self._lock:
+            value = self._counters.get(key)
+            if value is None:
+                return self._counter_floor
+            self._counters.move_to_end(key)
+            return value
+
+    def incr(self, key):
+        with self._lock:
+            value = self._counters.get(key, self._counter_floor) + 1
+            self._counters[key] = value
+            self._counters.move_to_end(key)
+            while len(self._counters) > self.max_entries:
+                _, evicted = self._counters.popitem(last=False)
+                self._counter_floor = max(self._counter_floor, evicted)
+            return value
+
+    def discard_where(self, predicate):
+        """Drop every entry whose value matches predicate; returns how many were dropped."""
+        with self._lock:
+            keys = [key for key, (_, value) in self._entries.items() if predicate(value)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache(CacheBackend):
+    """Shared backend so every worker sees the same entries and invalidations."""
+
+    def __init__(self, url: str):
+        import redis  # optional dependency, only needed when CACHE_URL is set
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self._client.get(key)
+
+    def set(self, key, value, ttl):
+        self._client.set(key, value, ex=ttl)
+
+    def counter(self, key):
+        value = self._client.get(key)
+        return int(value) if value else 0
+
+    def incr(self, key):
+        return self._client.incr(key)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> CacheBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = RedisCache(CACHE_URL) if CACHE_URL else InMemoryCache()
+    return _backend
+
+
+def set_backend(backend: CacheBackend):
+    global _backend
+    _backend = backend
+
+
+def _generation_key(user_id):
+    return f"flowstate:gen:{user_id}"
+
+
+def dashboard_key(user_id, category_id=None, variant="json"):
+    """Cache key for one user's dashboard in one wire format; changes whenever the user writes."""
+    generation = get_backend().counter(_generation_key(user_id))
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    return f"flowstate:dashboard:{user_id}:{generation}:{category_id or 'all'}:{today}:{variant}"
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def get(key):
+    """Returns (etag, body) or None."""
+    value = get_backend().get(key)
+    if value is None:
+        return None
+    etag, body = value.split(b"\n", 1)
+    return etag.decode(), body
+
+
+def put(key, body: bytes, ttl: int = DASHBOARD_CACHE_TTL) -> str:
+    etag = make_etag(body)
+    get_backend().set(key, etag.encode() + b"\n" + body, ttl)
+    return etag
+
+
+def get_gzipped(key, etag: str, body: bytes, ttl: int = DASHBOARD_CACHE_TTL):
+    """
+    Gzip-encoded form of a cached body, compressed once and cached next to it.
+    Returns (etag, compressed body); the ETag gets a -gzip suffix because the
+    bytes on the wire differ from the identity encoding.
+    """
+    gzip_key = key + ":gzip"
+    cached = get(gzip_key)
+    if cached:
+        return cached
+    compressed = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    gzip_etag = etag[:-1] + '-gzip"'
+    get_backend().set(gzip_key, gzip_etag.encode() + b"\n" + compressed, ttl)
+    return gzip_etag, compressed
+
+
+def invalidate_user(user_id):
+    get_backend().incr(_generation_key(user_id))
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match uses the weak comparison (RFC 9110 13.1.2)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
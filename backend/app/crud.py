@@ -1,27 +1,52 @@
 from sqlalchemy.orm import Session
-from . import models, schemas, auth
-from datetime import datetime
+from sqlalchemy import String, bindparam, cast, delete, literal, select, text, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from . import models, schemas, auth, rollup, cache, serialization
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from uuid import UUID, uuid4
+import base64
 
 # --- User ---
 def get_user_by_username(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
 
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = auth.get_password_hash(user.password)
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: str = None):
+    # Request handlers hash on the bcrypt pool (hashing.py) and pass the result in
+    if hashed_password is None:
+        hashed_password = auth.get_password_hash(user.password)
     db_user = models.User(username=user.username, email=user.email, hashed_password=hashed_password)
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
     return db_user
 
+def update_user_password_hash(db: Session, user: models.User, hashed_password: str):
+    user.hashed_password = hashed_password
+    db.commit()
+    return user
+
 # --- Category ---
 def get_categories(db: Session, user_id: str, skip: int = 0, limit: int = 100):
     return db.query(models.Category).filter(models.Category.user_id == user_id).offset(skip).limit(limit).all()
 
+def get_category_rows(db: Session, user_id: str, skip: int = 0, limit: int = 100):
+    """get_categories as plain dicts of the schemas.Category fields, for serialization.FastJSONResponse."""
+    query = select(
+        models.Category.name, models.Category.color_code, models.Category.id, models.Category.user_id
+    ).where(models.Category.user_id == user_id).offset(skip).limit(limit)
+    return serialization.rows_as_dicts(db.execute(query))
+
+def user_owns_category(db: Session, category_id: int, user_id: str):
+    return db.query(models.Category.id).filter(
+        models.Category.id == category_id, models.Category.user_id == user_id
+    ).first() is not None
+
 def create_user_category(db: Session, category: schemas.CategoryCreate, user_id: str):
     db_category = models.Category(**category.dict(), user_id=user_id)
     db.add(db_category)
     db.commit()
+    cache.invalidate_user(user_id)
     db.refresh(db_category)
     return db_category
 
@@ -31,26 +56,113 @@ def update_user_category(db: Session, category_id: int, category_update: schemas
         for key, value in category_update.dict().items():
             setattr(db_category, key, value)
         db.commit()
+        cache.invalidate_user(user_id)
         db.refresh(db_category)
     return db_category
 
+def _move_category_sessions(db: Session, user_id: str, category_id: int, to_category_id: int = None):
+    """Move all of a user's sessions (and rollup rows) from one category to another in two set-based statements."""
+    # user_id + category_id: served by ix_focus_sessions_category_id, and never touches another user's rows
+    moved = db.execute(
+        update(models.FocusSession)
+        .where(models.FocusSession.user_id == user_id, models.FocusSession.category_id == category_id)
+        .values(category_id=to_category_id)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    rollup.move_category(db, user_id, category_id, to_category_id)
+    return moved
+
+def _delete_category_row(db: Session, category_id: int, user_id: str):
+    # Core DELETE: the ORM would first load category.focus_sessions to null them, which is already done.
+    # Its RETURNING feeds the tombstone for GET /sync, in the same statement.
+    deleted = delete(models.Category).where(
+        models.Category.id == category_id, models.Category.user_id == user_id
+    ).returning(models.Category.id, models.Category.user_id).cte("deleted")
+    db.execute(insert(models.SyncTombstone).from_select(
+        ["user_id", "entity", "entity_id"],
+        select(deleted.c.user_id, literal("category"), cast(deleted.c.id, String))
+    ).add_cte(deleted))
+
 def delete_user_category(db: Session, category_id: int, user_id: str):
     db_category = db.query(models.Category).filter(models.Category.id == category_id, models.Category.user_id == user_id).first()
     if db_category:
         # Set category_id to NULL for associated sessions to preserve logs
-        db.query(models.FocusSession).filter(models.FocusSession.category_id == category_id).update({"category_id": None})
-        
-        db.delete(db_category)
+        _move_category_sessions(db, user_id, category_id, None)
+        _delete_category_row(db, category_id, user_id)
         db.commit()
+        cache.invalidate_user(user_id)
         return True
     return False
 
+def merge_user_categories(db: Session, category_id: int, into_category_id: int, user_id: str):
+    """
+    Move every session of category_id into into_category_id and delete category_id,
+    in one transaction. Returns (target category, moved session count), or None if
+    either category is missing or not the user's.
+    """
+    if category_id == into_category_id:
+        return None
+    categories = {c.id: c for c in db.query(models.Category).filter(
+        models.Category.id.in_([category_id, into_category_id]), models.Category.user_id == user_id
+    ).with_for_update()}
+    if len(categories) != 2:
+        return None
+    moved = _move_category_sessions(db, user_id, category_id, into_category_id)
+    _delete_category_row(db, category_id, user_id)
+    db.commit()
+    cache.invalidate_user(user_id)
+    return categories[into_category_id], moved
+
 # --- Focus Session ---
 def get_focus_sessions(db: Session, user_id: str, skip: int = 0, limit: int = 100, category_id: int = None):
     query = db.query(models.FocusSession).filter(models.FocusSession.user_id == user_id)
     if category_id:
         query = query.filter(models.FocusSession.category_id == category_id)
-    return query.order_by(models.FocusSession.start_time.desc()).offset(skip).limit(limit).all()
+    return query.order_by(models.FocusSession.start_time.desc(), models.FocusSession.id.desc()).offset(skip).limit(limit).all()
+
+def get_focus_session_rows(db: Session, user_id: str, skip: int = 0, limit: int = 100, category_id: int = None):
+    """get_focus_sessions as plain dicts of the schemas.FocusSession fields, without loading ORM objects."""
+    fs = models.FocusSession
+    query = select(
+        fs.duration_minutes, fs.status, fs.note, fs.category_id, fs.id, fs.user_id, fs.start_time, fs.end_time
+    ).where(fs.user_id == user_id)
+    if category_id:
+        query = query.where(fs.category_id == category_id)
+    query = query.order_by(fs.start_time.desc(), fs.id.desc()).offset(skip).limit(limit)
+    return serialization.rows_as_dicts(db.execute(query))
+
+def encode_session_cursor(session: models.FocusSession):
+    """Opaque keyset cursor: the (start_time, id) of the last row on a page."""
+    raw = f"{session.start_time.isoformat()}|{session.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_session_cursor(cursor: str):
+    """Raises ValueError for anything that is not a cursor we issued."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        start_time, session_id = raw.split("|")
+        return datetime.fromisoformat(start_time), UUID(session_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+def get_focus_sessions_page(db: Session, user_id: str, limit: int = 100, after: tuple = None, category_id: int = None):
+    """
+    Keyset pagination over (start_time DESC, id DESC), served by ix_focus_sessions_user_start_id.
+    Cost does not depend on how deep the page is, and rows inserted meanwhile never shift pages.
+    `after` is a decoded cursor (decode_session_cursor): the page starts below that row.
+    Returns (sessions, next_cursor); next_cursor is None on the last page.
+    """
+    query = db.query(models.FocusSession).filter(models.FocusSession.user_id == user_id)
+    if category_id:
+        query = query.filter(models.FocusSession.category_id == category_id)
+    if after:
+        query = query.filter(tuple_(models.FocusSession.start_time, models.FocusSession.id) < tuple_(*after))
+    sessions = query.order_by(
+        models.FocusSession.start_time.desc(), models.FocusSession.id.desc()
+    ).limit(limit + 1).all()
+
+    next_cursor = encode_session_cursor(sessions[limit - 1]) if len(sessions) > limit else None
+    return sessions[:limit], next_cursor
 
 def create_focus_session(db: Session, session: schemas.FocusSessionCreate, user_id: str):
     # Calculate end_time based on duration if needed, or just set current time as completion time
@@ -70,15 +182,296 @@ def create_focus_session(db: Session, session: schemas.FocusSessionCreate, user_
         end_time=now
     )
     db.add(db_session)
+    rollup.add(db, [rollup.contribution(db_session)])
     db.commit()
+    cache.invalidate_user(user_id)
     db.refresh(db_session)
     return db_session
 
+BATCH_INSERT_CHUNK = 1000  # rows per INSERT statement (stays well under the bind parameter limit)
+
+def _utc_naive(value: datetime):
+    # Columns hold naive UTC; clients may send offsets
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def create_focus_sessions_batch(db: Session, items: list, user_id: str):
+    """
+    Insert many sessions with client-supplied times in one transaction.
+    Items whose idempotency_key was already stored (or repeats earlier in the batch)
+    are reported as duplicates instead of inserted, so a retried batch is a no-op.
+    Returns one result dict per item, in input order.
+    """
+    results = [None] * len(items)
+    valid_statuses = {s.value for s in models.SessionStatus}
+    category_ids = {
+        row.id for row in db.query(models.Category.id).filter(models.Category.user_id == user_id)
+    }
+
+    # Validate everything up front, and dedupe keys within the batch
+    pending = []
+    first_index_for_key = {}
+    for index, item in enumerate(items):
+        start_time, end_time = _utc_naive(item.start_time), _utc_naive(item.end_time)
+        error = None
+        if item.status not in valid_statuses:
+            error = f"status must be one of {sorted(valid_statuses)}"
+        elif item.duration_minutes < 0:
+            error = "duration_minutes must not be negative"
+        elif end_time < start_time:
+            error = "end_time is before start_time"
+        elif item.category_id is not None and item.category_id not in category_ids:
+            error = "category not found"
+        if error:
+            results[index] = {"index": index, "status": "invalid", "error": error}
+            continue
+
+        key = item.idempotency_key
+        if key is not None:
+            if key in first_index_for_key:
+                results[index] = {"index": index, "status": "duplicate", "duplicate_of": first_index_for_key[key]}
+                continue
+            first_index_for_key[key] = index
+        pending.append((index, {
+            "id": uuid4(),
+            "user_id": user_id,
+            "category_id": item.category_id,
+            "start_time": start_time,
+            "end_time": end_time,
+            "duration_minutes": item.duration_minutes,
+            "status": item.status,
+            "note": item.note,
+            "idempotency_key": key,
+        }))
+
+    # Keys already stored by an earlier attempt
+    existing = {}
+    keys = list(first_index_for_key)
+    for i in range(0, len(keys), BATCH_INSERT_CHUNK):
+        existing.update(db.query(models.FocusSession.idempotency_key, models.FocusSession.id).filter(
+            models.FocusSession.user_id == user_id,
+            models.FocusSession.idempotency_key.in_(keys[i:i + BATCH_INSERT_CHUNK])
+        ).all())
+
+    rows = []
+    for index, row in pending:
+        if row["idempotency_key"] in existing:
+            results[index] = {"index": index, "status": "duplicate", "id": existing[row["idempotency_key"]]}
+        else:
+            rows.append((index, row))
+
+    inserted = set()
+    for i in range(0, len(rows), BATCH_INSERT_CHUNK):
+        chunk = [row for _, row in rows[i:i + BATCH_INSERT_CHUNK]]
+        # A concurrent retry may have stored the same key since the lookup above: skip those rows
+        stmt = insert(models.FocusSession).values(chunk).on_conflict_do_nothing(
+            index_elements=[models.FocusSession.user_id, models.FocusSession.idempotency_key, models.FocusSession.start_time],
+            index_where=models.FocusSession.idempotency_key.is_not(None)
+        ).returning(models.FocusSession.id)
+        inserted.update(db.execute(stmt).scalars())
+
+    contributions = []
+    raced = []
+    for index, row in rows:
+        if row["id"] in inserted:
+            results[index] = {"index": index, "status": "created", "id": row["id"]}
+            contributions.append(rollup.contribution(SimpleNamespace(**row)))
+        else:
+            raced.append((index, row["idempotency_key"]))
+    if raced:
+        stored = dict(db.query(models.FocusSession.idempotency_key, models.FocusSession.id).filter(
+            models.FocusSession.user_id == user_id,
+            models.FocusSession.idempotency_key.in_([key for _, key in raced])
+        ).all())
+        for index, key in raced:
+            results[index] = {"index": index, "status": "duplicate", "id": stored.get(key)}
+
+    rollup.add(db, contributions)
+    db.commit()
+    if inserted:
+        cache.invalidate_user(user_id)
+    return results
+
 def update_focus_session(db: Session, session_id: str, session_update: schemas.FocusSessionUpdate, user_id: str):
-    db_session = db.query(models.FocusSession).filter(models.FocusSession.id == session_id, models.FocusSession.user_id == user_id).first()
+    # Locked until commit: a concurrent edit of the same session waits, so `before` is what the rollup holds
+    db_session = db.query(models.FocusSession).filter(
+        models.FocusSession.id == session_id, models.FocusSession.user_id == user_id
+    ).with_for_update().first()
     if db_session:
+        before = rollup.contribution(db_session)
         for key, value in session_update.dict(exclude_unset=True).items():
             setattr(db_session, key, value)
+        after = rollup.contribution(db_session)
+        if before != after:
+            rollup.apply(db, removed=[before], added=[after])
         db.commit()
+        cache.invalidate_user(user_id)
         db.refresh(db_session)
     return db_session
+
+def reassign_focus_sessions(db: Session, session_ids: list, category_id: int, user_id: str):
+    """
+    Set the category of many sessions in one UPDATE. Returns the number of sessions
+    changed, or None if category_id is not one of the user's categories.
+    Ids that are not the user's, or already in the category, are skipped.
+    """
+    if category_id is not None and not user_owns_category(db, category_id, user_id):
+        return None
+
+    # Self-join: `old` is read from the statement's snapshot, so RETURNING sees the
+    # category each session is moving out of
+    fs = models.FocusSession.__table__
+    old = fs.alias("old")
+    rows = db.execute(
+        update(fs)
+        .where(
+            fs.c.id == old.c.id,
+            fs.c.user_id == user_id,
+            fs.c.id.in_(session_ids),
+            fs.c.category_id.is_distinct_from(category_id),
+        )
+        .values(category_id=category_id)
+        .returning(old.c.category_id, fs.c.start_time, fs.c.duration_minutes, fs.c.status)
+    ).all()
+
+    removed, added = [], []
+    for old_category_id, start_time, duration_minutes, status in rows:
+        session = SimpleNamespace(user_id=user_id, category_id=old_category_id, start_time=start_time, duration_minutes=duration_minutes, status=status)
+        removed.append(rollup.contribution(session))
+        session.category_id = category_id
+        added.append(rollup.contribution(session))
+    rollup.apply(db, removed=removed, added=added)
+    db.commit()
+    if rows:
+        cache.invalidate_user(user_id)
+    return len(rows)
+
+# --- Live Timer ---
+def get_active_session(db: Session, user_id: str):
+    return db.get(models.ActiveSession, user_id)
+
+def begin_active_session(db: Session, row: dict):
+    """
+    Store a new live timer. Returns False if the user already has one: the primary
+    key decides between workers that start a timer at the same moment.
+    """
+    created = db.execute(
+        insert(models.ActiveSession).values(row)
+        .on_conflict_do_nothing(index_elements=[models.ActiveSession.user_id])
+        .returning(models.ActiveSession.user_id)
+    ).first()
+    db.commit()
+    return created is not None
+
+def save_active_sessions(db: Session, rows: list):
+    """
+    Checkpoint live timers (pauses and resumes). Only updates rows that still exist and
+    hold an older version, so a late checkpoint never revives a finished timer.
+    """
+    table = models.ActiveSession.__table__
+    columns = [column for column in rows[0] if column != "user_id"]
+    db.execute(
+        update(table)
+        .where(table.c.user_id == bindparam("b_user_id"), table.c.version < bindparam("b_version"))
+        .values({column: bindparam(f"b_{column}") for column in columns}),
+        [{f"b_{column}": value for column, value in row.items()} for row in rows]
+    )
+    db.commit()
+
+def take_active_session(db: Session, user_id: str):
+    """
+    Delete the user's timer row and return it, or None if another request finished it
+    first (a concurrent take waits for this transaction). Commit comes with finish_active_session.
+    """
+    table = models.ActiveSession.__table__
+    return db.execute(delete(table).where(table.c.user_id == user_id).returning(*table.c)).first()
+
+def finish_active_session(db: Session, user_id: str, category_id: int, note: str, start_time: datetime, end_time: datetime, duration_minutes: int, status: str):
+    """Store a finished live timer as a focus session; commits together with take_active_session."""
+    if category_id is not None and not user_owns_category(db, category_id, user_id):
+        category_id = None  # deleted while the timer ran
+    db_session = models.FocusSession(
+        user_id=user_id,
+        category_id=category_id,
+        note=note,
+        start_time=start_time,
+        end_time=end_time,
+        duration_minutes=duration_minutes,
+        status=status
+    )
+    db.add(db_session)
+    rollup.add(db, [rollup.contribution(db_session)])
+    db.commit()
+    cache.invalidate_user(user_id)
+    db.refresh(db_session)
+    return db_session
+
+# --- Sync ---
+def encode_sync_token(since: int, until: int = None, after: tuple = None):
+    """
+    Opaque GET /sync token. A finished sync is just the version to continue from;
+    a page in the middle of a sync also carries where it stopped.
+    """
+    raw = str(since) if after is None else f"{since}|{until}|{after[0]}|{after[1]}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_sync_token(token: str):
+    """(since, until, after); raises ValueError for anything that is not a token we issued."""
+    try:
+        parts = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode().split("|")
+        if len(parts) == 1:
+            return int(parts[0]), None, None
+        since, until, version, session_id = parts
+        return int(since), int(until), (int(version), UUID(session_id))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid sync token") from e
+
+def get_changes(db: Session, user_id: str, token: str = None, limit: int = 500):
+    """
+    Categories, sessions and deletions of a user since a sync token (everything, without one).
+
+    Versions are transaction ids. The token handed back is the xmin of the snapshot
+    taken at the start of the sync: every transaction below it had finished, so a
+    transaction that commits later always writes a version >= the token and is picked
+    up next time. Rows from transactions in flight may be sent twice; applying a
+    change is idempotent for clients. Sessions are paged in (version, id) order; the
+    categories and deletions come with the first page.
+    Returns (categories, sessions, deleted categories, deleted sessions, token, has_more).
+    """
+    since, until, after = decode_sync_token(token) if token else (0, None, None)
+    categories, deleted_categories, deleted_sessions = [], [], []
+    if after is None:
+        until = db.execute(text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")).scalar()
+        c = models.Category
+        categories = serialization.rows_as_dicts(db.execute(
+            select(c.name, c.color_code, c.id, c.user_id)
+            .where(c.user_id == user_id, c.version >= since).order_by(c.id)
+        ))
+        if token:  # a first sync has nothing to delete
+            t = models.SyncTombstone
+            for entity, entity_id in db.execute(
+                select(t.entity, t.entity_id).where(t.user_id == user_id, t.version >= since).order_by(t.version, t.id)
+            ):
+                if entity == "category":
+                    deleted_categories.append(int(entity_id))
+                else:
+                    deleted_sessions.append(UUID(entity_id))
+
+    fs = models.FocusSession
+    query = select(
+        fs.duration_minutes, fs.status, fs.note, fs.category_id, fs.id, fs.user_id, fs.start_time, fs.end_time, fs.version
+    ).where(fs.user_id == user_id, fs.version >= since)
+    if after is not None:
+        query = query.where(tuple_(fs.version, fs.id) > tuple_(*after))
+    sessions = serialization.rows_as_dicts(db.execute(query.order_by(fs.version, fs.id).limit(limit + 1)))
+
+    has_more = len(sessions) > limit
+    sessions = sessions[:limit]
+    if has_more:
+        next_token = encode_sync_token(since, until, (sessions[-1]["version"], sessions[-1]["id"]))
+    else:
+        next_token = encode_sync_token(until)
+    for row in sessions:
+        del row["version"]
+    return categories, sessions, deleted_categories, deleted_sessions, next_token, has_more
@@ -1,7 +1,11 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 import os
+import time
 
 # DB Connection URL
 # Docker Composeの環境変数から取得することを想定
@@ -10,19 +14,189 @@ db_url = os.getenv("DATABASE_URL", "postgresql://user:password@db/flowstate")
 if db_url.startswith("postgres://"):
     db_url = db_url.replace("postgres://", "postgresql://", 1)
 
-# Create SQLAlchemy engine
-engine = create_engine(db_url)
+# Engine profiles, chosen with DB_PROFILE:
+#   default     SQLAlchemy defaults (pool of 5 + 10 overflow), no statement timeout
+#   server      long-running uvicorn workers: bigger pool, pre-ping, recycle, timeouts
+#   serverless  short-lived instances, or PgBouncer in transaction mode: NullPool,
+#               so an idle instance holds no connections and PgBouncer does the pooling
+# Every setting can be overridden with DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+# DB_POOL_RECYCLE, DB_POOL_PRE_PING and DB_STATEMENT_TIMEOUT_MS (0 = no timeout).
+# Pool settings apply per engine (each process has a sync and an async one); the
+# statement timeout applies to the async engine that serves API requests.
+PROFILES = {
+    "default": {
+        "pooled": True,
+    },
+    "server": {
+        "pooled": True,
+        "pool_size": 20,
+        "max_overflow": 10,
+        "pool_timeout": 10,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+        "statement_timeout_ms": 15000,
+    },
+    "serverless": {
+        "pooled": False,
+        "pool_pre_ping": False,  # every checkout is a fresh connection anyway
+        "statement_timeout_ms": 10000,
+    },
+}
 
-# Create SessionLocal class
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+DB_PROFILE = os.getenv("DB_PROFILE", "default")
+if DB_PROFILE not in PROFILES:
+    raise ValueError(f"Unknown DB_PROFILE {DB_PROFILE!r}, expected one of {', '.join(PROFILES)}")
+
+def _profile_settings(profile):
+    settings = dict(PROFILES[profile])
+    for key, env, parse in (
+        ("pool_size", "DB_POOL_SIZE", int),
+        ("max_overflow", "DB_MAX_OVERFLOW", int),
+        ("pool_timeout", "DB_POOL_TIMEOUT", float),
+        ("pool_recycle", "DB_POOL_RECYCLE", int),
+        ("pool_pre_ping", "DB_POOL_PRE_PING", lambda v: v.lower() in ("1", "true", "yes")),
+        ("statement_timeout_ms", "DB_STATEMENT_TIMEOUT_MS", int),
+    ):
+        if os.getenv(env):
+            settings[key] = parse(os.getenv(env))
+    return settings
+
+engine_settings = _profile_settings(DB_PROFILE)
+
+class PoolStats:
+    """Checkout counters for one engine; a checkout's wait includes connecting when a new connection is opened."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+def _timed_pool(pool_class):
+    """Subclass of pool_class that records how long each checkout waits."""
+    class TimedPool(pool_class):
+        stats = PoolStats()  # class attribute: survives pool.recreate() on engine.dispose()
+
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return super()._do_get()
+            except exc.TimeoutError:
+                self.stats.timeouts += 1
+                raise
+            finally:
+                wait_ms = (time.perf_counter() - started) * 1000
+                self.stats.checkouts += 1
+                self.stats.total_wait_ms += wait_ms
+                self.stats.max_wait_ms = max(self.stats.max_wait_ms, wait_ms)
+
+    TimedPool.__name__ = "Timed" + pool_class.__name__
+    return TimedPool
+
+def _engine_kwargs(settings, queue_pool_class, timeout_arg=None):
+    kwargs = {"pool_pre_ping": settings.get("pool_pre_ping", False)}
+    if settings["pooled"]:
+        kwargs["poolclass"] = _timed_pool(queue_pool_class)
+        for key in ("pool_size", "max_overflow", "pool_timeout", "pool_recycle"):
+            if key in settings:
+                kwargs[key] = settings[key]
+    else:
+        kwargs["poolclass"] = _timed_pool(NullPool)
+
+    # Sent as a startup parameter, so it costs no extra round trip. PgBouncer rejects
+    # unknown startup parameters: behind it, set DB_STATEMENT_TIMEOUT_MS=0 and use
+    # ALTER ROLE ... SET statement_timeout instead.
+    timeout_ms = settings.get("statement_timeout_ms")
+    if timeout_ms and timeout_arg:
+        kwargs["connect_args"] = timeout_arg(timeout_ms)
+    return kwargs
+
+# Sync engine for scripts, migrations and the CLI tools. The API never touches it, so
+# it (and psycopg2) is created on first access of database.engine / database.SessionLocal
+# rather than at import, which keeps it off the cold-start path.
+# No statement timeout here: rollup rebuilds and seeding may legitimately run long.
+_engine = None
+_session_factory = None
+
+def _sync_engine():
+    global _engine, _session_factory
+    if _engine is None:
+        _engine = create_engine(db_url, **_engine_kwargs(engine_settings, QueuePool))
+        _session_factory = sessionmaker(autocommit=False, autoflush=False, bind=_engine)
+    return _engine
+
+def __getattr__(name):
+    if name == "engine":
+        return _sync_engine()
+    if name == "SessionLocal":
+        _sync_engine()
+        return _session_factory
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _async_url(url):
+    """Same database through asyncpg (libpq's sslmode is spelled ssl there)."""
+    url = make_url(url)
+    if url.drivername in ("postgresql", "postgresql+psycopg2"):
+        url = url.set(drivername="postgresql+asyncpg")
+        if "sslmode" in url.query:
+            url = url.update_query_dict({"ssl": url.query["sslmode"]}).difference_update_query(["sslmode"])
+    return url
+
+# Async engine used by the API routes so database I/O never blocks the event loop.
+_async_kwargs = _engine_kwargs(
+    engine_settings, AsyncAdaptedQueuePool, lambda ms: {"server_settings": {"statement_timeout": str(ms)}}
+)
+if not engine_settings["pooled"]:
+    # Prepared statements are per server connection, which PgBouncer's transaction
+    # mode does not pin; keep asyncpg from caching them
+    _async_kwargs.setdefault("connect_args", {})["statement_cache_size"] = 0
+    _async_kwargs["connect_args"]["prepared_statement_cache_size"] = 0
+async_engine = create_async_engine(_async_url(db_url), **_async_kwargs)
+
+# expire_on_commit=False: returned ORM objects are serialized after the commit,
+# outside the session, where a lazy refresh would need blocking I/O
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 # Base class for models
 Base = declarative_base()
 
 # Dependency to get DB session
 def get_db():
-    db = SessionLocal()
+    _sync_engine()
+    db = _session_factory()
     try:
         yield db
     finally:
         db.close()
+
+# Async dependency for the API routes
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def pool_stats():
+    """Checkout wait and saturation per engine, for /metrics."""
+    stats = {}
+    for name, created in (("sync", _engine), ("async", async_engine.sync_engine)):
+        if created is None:
+            continue  # sync engine never used in this process
+        pool = created.pool
+        counters = pool.stats
+        entry = {
+            "profile": DB_PROFILE,
+            "checkouts": counters.checkouts,
+            "timeouts": counters.timeouts,
+            "avg_wait_ms": counters.total_wait_ms / counters.checkouts if counters.checkouts else 0.0,
+            "max_wait_ms": counters.max_wait_ms,
+        }
+        if isinstance(pool, QueuePool):
+            capacity = pool.size() + max(pool._max_overflow, 0)
+            entry.update({
+                "size": pool.size(),
+                "capacity": capacity,
+                "checked_out": pool.checkedout(),
+                "idle": pool.checkedin(),
+                "saturation": pool.checkedout() / capacity if capacity else 0.0,
+            })
+        stats[name] = entry
+    return stats
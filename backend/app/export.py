@@ -0,0 +1,85 @@
+"""
+Streaming export of a user's session history as NDJSON or CSV.
+
+Rows are read through a server-side cursor in batches of EXPORT_BATCH_SIZE and
+written out as each batch arrives, so memory stays flat however long the history is.
+The generators open their own session: the response body is produced after the
+route has returned, when request-scoped dependencies may already be closed.
+"""
+import csv
+import io
+import json
+import os
+
+from sqlalchemy import select
+
+from . import database, models
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+COLUMNS = ["id", "start_time", "end_time", "duration_minutes", "status", "category_id", "category", "note"]
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def export_query(user_id, category_id=None, start=None, end=None):
+    fs = models.FocusSession
+    query = select(
+        fs.id, fs.start_time, fs.end_time, fs.duration_minutes, fs.status,
+        fs.category_id, models.Category.name, fs.note
+    ).outerjoin(
+        models.Category, models.Category.id == fs.category_id
+    ).where(fs.user_id == user_id)
+    if category_id:
+        query = query.where(fs.category_id == category_id)
+    if start:
+        query = query.where(fs.start_time >= start)
+    if end:
+        query = query.where(fs.start_time < end)
+    # Oldest first; served by ix_focus_sessions_user_start_id
+    return query.order_by(fs.start_time, fs.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+
+async def _batches(query):
+    async with database.AsyncSessionLocal() as db:
+        result = await db.stream(query)
+        async for rows in result.partitions():
+            yield rows
+
+
+def _values(row):
+    return [
+        str(row[0]),
+        row[1].isoformat() if row[1] else None,
+        row[2].isoformat() if row[2] else None,
+        row[3], row[4], row[5], row[6], row[7]
+    ]
+
+
+async def ndjson_stream(query):
+    async for rows in _batches(query):
+        yield "".join(
+            json.dumps(dict(zip(COLUMNS, _values(row))), ensure_ascii=False) + "\n" for row in rows
+        ).encode("utf-8")
+
+
+async def csv_stream(query):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    async for rows in _batches(query):
+        writer.writerows(_values(row) for row in rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+STREAMS = {
+    "ndjson": ndjson_stream,
+    "csv": csv_stream,
+}
@@ -0,0 +1,164 @@
+"""
+Password hashing off the request path.
+
+bcrypt runs on a bounded process pool (BCRYPT_WORKERS processes, 0 = default
+threadpool). At most BCRYPT_MAX_PENDING hashes may be queued or running at once;
+beyond that callers get PoolSaturated immediately instead of queueing behind a
+login burst and starving the rest of the API.
+
+Cost factor: BCRYPT_ROUNDS is the cost for new hashes, and stored hashes with any
+other cost are reported by verify_and_update with a replacement hash, so changing
+it migrates users on their next successful login. To pick a value for a latency target:
+    python -m app.hashing calibrate --target-ms 250
+
+This module is imported by the pool's worker processes, so it must not import the
+rest of the app.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", str(max(1, BCRYPT_WORKERS) * 8)))
+
+_context = None
+
+
+def get_context():
+    """The shared CryptContext; passlib is imported on first use, not at startup."""
+    global _context
+    if _context is None:
+        from passlib.context import CryptContext
+        # min/max rounds only drive needs_update: hashes of any cost still verify
+        _context = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=BCRYPT_ROUNDS,
+            bcrypt__min_rounds=BCRYPT_ROUNDS,
+            bcrypt__max_rounds=BCRYPT_ROUNDS,
+        )
+    return _context
+
+
+class PoolSaturated(Exception):
+    """Raised when BCRYPT_MAX_PENDING hashes are already in flight."""
+
+
+# --- Work functions (run inside the pool) ---
+def _hash(password):
+    return get_context().hash(password)
+
+
+def _verify_and_update(password, hashed_password):
+    return get_context().verify_and_update(password, hashed_password)
+
+
+# --- Pool ---
+_executor = None
+_pending = 0
+_stats = {"completed": 0, "rejected": 0, "total_ms": 0.0}
+
+
+def _get_executor():
+    global _executor
+    if BCRYPT_WORKERS <= 0:
+        return None  # loop's default threadpool
+    if _executor is None:
+        import atexit
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # spawn: forking a process that already runs the event loop and DB pools is unsafe
+        _executor = ProcessPoolExecutor(max_workers=BCRYPT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        # Callers that never reach the lifespan shutdown (scripts, tests) still stop the workers cleanly
+        atexit.register(shutdown)
+    return _executor
+
+
+async def _submit(fn, *args):
+    global _pending
+    if _pending >= BCRYPT_MAX_PENDING:
+        _stats["rejected"] += 1
+        raise PoolSaturated()
+
+    _pending += 1
+    started = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), fn, *args)
+    finally:
+        _pending -= 1
+        _stats["completed"] += 1
+        _stats["total_ms"] += (time.perf_counter() - started) * 1000
+
+
+async def hash_password(password: str) -> str:
+    return await _submit(_hash, password)
+
+
+async def verify_and_update(password: str, hashed_password: str):
+    """Returns (valid, new_hash); new_hash is set when the stored cost differs from BCRYPT_ROUNDS."""
+    return await _submit(_verify_and_update, password, hashed_password)
+
+
+def pool_stats():
+    return {
+        "workers": BCRYPT_WORKERS,
+        "max_pending": BCRYPT_MAX_PENDING,
+        "pending": _pending,
+        "completed": _stats["completed"],
+        "rejected": _stats["rejected"],
+        "avg_ms": _stats["total_ms"] / _stats["completed"] if _stats["completed"] else 0.0,
+        "rounds": BCRYPT_ROUNDS,
+    }
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+# --- Cost calibration ---
+def measure_rounds(rounds: int, samples: int = 3) -> float:
+    """Median milliseconds for one bcrypt hash at the given cost on this machine."""
+    from passlib.context import CryptContext
+    context = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=rounds)
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.hash("calibration-password")
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def calibrate(target_ms: float, min_rounds: int = 10, max_rounds: int = 16):
+    """Highest cost whose hash time stays within target_ms (never below min_rounds)."""
+    chosen = min_rounds
+    results = {}
+    for rounds in range(min_rounds, max_rounds + 1):
+        results[rounds] = measure_rounds(rounds)
+        if results[rounds] > target_ms:
+            break
+        chosen = rounds
+    return chosen, results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.hashing", description="bcrypt cost calibration")
+    parser.add_argument("command", choices=["calibrate"])
+    parser.add_argument("--target-ms", type=float, default=250.0, help="latency budget for one hash")
+    args = parser.parse_args(argv)
+
+    chosen, results = calibrate(args.target_ms)
+    for rounds, ms in results.items():
+        print(f"  rounds={rounds:<3} {ms:8.1f} ms")
+    print(f"Recommended: BCRYPT_ROUNDS={chosen} (current: {BCRYPT_ROUNDS})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Database readiness probe.
+
+Startup never waits on the database: the lifespan hook starts this probe in the
+background and the app accepts requests straight away. GET /health/ready answers
+503 until the probe has reached the database and found it at the head revision of
+alembic/versions (so not while a deploy's migration is still pending), then 200.
+The schema itself is managed only by migrations (`alembic upgrade head`, run by the
+Docker image before uvicorn starts), never by the app.
+"""
+import asyncio
+import logging
+import os
+
+from sqlalchemy import text
+
+from . import database
+
+READINESS_RETRY_INTERVAL = float(os.getenv("READINESS_RETRY_INTERVAL", "0.5"))  # seconds, doubles per failure
+READINESS_RETRY_MAX_INTERVAL = float(os.getenv("READINESS_RETRY_MAX_INTERVAL", "10"))
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic")
+
+logger = logging.getLogger(__name__)
+
+
+class NotMigrated(Exception):
+    """The database answers but is not at the head revision: run `alembic upgrade head`."""
+
+
+def head_revision():
+    # Read from the migration scripts, not the database; alembic is imported here to keep it off cold start
+    from alembic.script import ScriptDirectory
+    return ScriptDirectory(MIGRATIONS_DIR).get_current_head()
+
+
+class ReadinessProbe:
+    def __init__(self, interval: float = READINESS_RETRY_INTERVAL, max_interval: float = READINESS_RETRY_MAX_INTERVAL):
+        self.interval = interval
+        self.max_interval = max_interval
+        self.ready = False
+        self.schema_version = None
+        self.head = None
+        self.attempts = 0
+        self.last_error = None
+        self._task = None
+
+    async def check(self):
+        """One attempt; returns the Alembic revision or raises."""
+        if self.head is None:
+            self.head = head_revision()
+        async with database.async_engine.connect() as conn:
+            migrated = await conn.scalar(text("SELECT to_regclass('alembic_version') IS NOT NULL"))
+            version = await conn.scalar(text("SELECT version_num FROM alembic_version")) if migrated else None
+        if not version:
+            raise NotMigrated("database schema is not migrated; run `alembic upgrade head`")
+        if version != self.head:
+            raise NotMigrated(f"database is at revision {version}, expected {self.head}; run `alembic upgrade head`")
+        return version
+
+    async def _run(self):
+        delay = self.interval
+        while not self.ready:
+            self.attempts += 1
+            try:
+                self.schema_version = await self.check()
+            except Exception as e:  # any failure only means "not ready yet"
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.warning("Database not ready (attempt %d): %s", self.attempts, self.last_error)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_interval)
+            else:
+                self.ready = True
+                self.last_error = None
+                logger.info("Database ready at schema revision %s", self.schema_version)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self):
+        return {
+            "status": "ready" if self.ready else "starting",
+            "schema_version": self.schema_version,
+            "expected_schema_version": self.head,
+            "attempts": self.attempts,
+            "error": self.last_error,
+        }
+
+
+probe = ReadinessProbe()
@@ -0,0 +1,417 @@
+"""
+Live timers: a focus session that is started, paused, resumed and finished on the
+server while it runs, with every change pushed to the user's other devices.
+
+Each worker keeps the running timers in memory (Registry). Starting and finishing
+go through active_sessions on the request path, so the database decides between
+workers: a start inserts the row (a second one for the user conflicts), a finish
+deletes it with RETURNING in the same transaction that stores the focus session (a
+second finish finds nothing). Pauses and resumes only change memory and are
+checkpointed every LIVE_CHECKPOINT_INTERVAL seconds.
+
+GET /live/stream is a Server-Sent Events stream. An idle stream is one asyncio.Queue
+waiting in the event loop: no thread, no pooled connection (the route releases its
+session before streaming). One heartbeat task writes a comment to every stream each
+LIVE_HEARTBEAT_INTERVAL seconds so proxies keep them open and dead clients are
+noticed. A slow client's queue keeps only the newest messages.
+
+With several workers, changes are fanned out with Postgres NOTIFY on the
+flowstate_live channel and each worker listens on one dedicated connection
+(LIVE_FANOUT=postgres, the default with a connection pool); a worker then reads a
+user's checkpoint once. LIVE_FANOUT=local skips it, as the serverless profile
+(PgBouncer in transaction mode) cannot hold a LISTEN: every request re-reads the
+checkpoint instead, so state is at most one checkpoint interval behind, and open
+streams only see changes made through their own worker.
+"""
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime
+from uuid import UUID, uuid4
+
+import orjson
+from sqlalchemy import text
+
+from . import crud, database, serialization
+
+LIVE_CHECKPOINT_INTERVAL = float(os.getenv("LIVE_CHECKPOINT_INTERVAL", "5"))  # seconds
+LIVE_HEARTBEAT_INTERVAL = float(os.getenv("LIVE_HEARTBEAT_INTERVAL", "15"))  # seconds
+LIVE_STREAM_QUEUE_SIZE = int(os.getenv("LIVE_STREAM_QUEUE_SIZE", "8"))
+LIVE_MAX_STREAMS_PER_USER = int(os.getenv("LIVE_MAX_STREAMS_PER_USER", "10"))
+LIVE_FANOUT = os.getenv("LIVE_FANOUT", "postgres" if database.engine_settings["pooled"] else "local")
+LIVE_RECONNECT_INTERVAL = 5.0  # seconds between LISTEN reconnect attempts
+
+CHANNEL = "flowstate_live"
+RETRY_MS = 3000  # EventSource reconnect delay sent to clients
+HEARTBEAT = b": keepalive\n\n"
+
+logger = logging.getLogger(__name__)
+
+
+class LiveConflict(Exception):
+    """The timer is not in a state that allows the operation (HTTP 409)."""
+
+
+class TooManyStreams(Exception):
+    """The user already has LIVE_MAX_STREAMS_PER_USER open streams on this worker (HTTP 429)."""
+
+
+class LiveSession:
+    """One user's timer. Immutable: every change makes a new instance with version + 1."""
+
+    __slots__ = ("state", "category_id", "note", "started_at", "resumed_at", "elapsed_seconds", "planned_minutes", "version")
+    FIELDS = __slots__
+
+    def __init__(self, state, category_id, note, started_at, resumed_at, elapsed_seconds, planned_minutes, version):
+        self.state = state
+        self.category_id = category_id
+        self.note = note
+        self.started_at = started_at
+        self.resumed_at = resumed_at
+        self.elapsed_seconds = elapsed_seconds
+        self.planned_minutes = planned_minutes
+        self.version = version
+
+    def replace(self, **changes):
+        values = {field: getattr(self, field) for field in self.FIELDS}
+        values.update(changes, version=self.version + 1)
+        return LiveSession(**values)
+
+    def elapsed(self, now: datetime) -> int:
+        """Running seconds as of now (paused time excluded)."""
+        if self.state == "running":
+            return self.elapsed_seconds + max(0, int((now - self.resumed_at).total_seconds()))
+        return self.elapsed_seconds
+
+    def as_row(self, user_id) -> dict:
+        return {"user_id": user_id, **{field: getattr(self, field) for field in self.FIELDS}}
+
+    def as_dict(self, now: datetime) -> dict:
+        """The schemas.LiveSession payload; clients extrapolate from elapsed_seconds and server_time."""
+        values = {field: getattr(self, field) for field in self.FIELDS}
+        values.update(elapsed_seconds=self.elapsed(now), server_time=now)
+        return values
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(**{field: getattr(row, field) for field in cls.FIELDS})
+
+    @classmethod
+    def from_message(cls, values: dict):
+        for field in ("started_at", "resumed_at"):
+            if values[field] is not None:
+                values[field] = datetime.fromisoformat(values[field])
+        return cls(**{field: values[field] for field in cls.FIELDS})
+
+
+def _event(session, now: datetime) -> bytes:
+    """One SSE message: the timer's current state, or null once it is finished."""
+    if session is None:
+        return b"event: state\ndata: null\n\n"
+    data = serialization.dumps(session.as_dict(now))
+    return b"id: %d\nevent: state\ndata: %s\n\n" % (session.version, data)
+
+
+class Registry:
+    def __init__(self, checkpoint_interval: float = LIVE_CHECKPOINT_INTERVAL,
+                 heartbeat_interval: float = LIVE_HEARTBEAT_INTERVAL, fanout: str = LIVE_FANOUT):
+        self.checkpoint_interval = checkpoint_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.fanout = fanout
+        self.origin = uuid4().hex  # tells this worker's own notifications apart
+        self.sessions = {}  # user_id -> LiveSession, users with a timer
+        self.loaded = set()  # users whose checkpoint has been read
+        self.dirty = set()  # users changed since the last checkpoint
+        self.streams = defaultdict(set)  # user_id -> {asyncio.Queue}
+        self.checkpoints = 0
+        self.last_error = None
+        self._flushing = asyncio.Lock()
+        self._tasks = []
+        self._listener = None
+
+    # --- State ---
+    async def load(self, db, user_id, fresh=False):
+        """
+        Read the user's checkpoint: the first time this worker sees them with Postgres
+        fanout (notifications keep memory current after that), on every call with local fanout.
+        """
+        if user_id in self.loaded and self.fanout == "postgres" and not fresh:
+            return
+        row = await db.run_sync(crud.get_active_session, user_id)
+        if user_id in self.loaded and self.fanout == "postgres" and not fresh:
+            return  # a notification arrived meanwhile
+        self._merge(user_id, LiveSession.from_row(row) if row is not None else None)
+        self.loaded.add(user_id)
+
+    def _merge(self, user_id, stored):
+        """Reconcile memory with the stored checkpoint; keeps unflushed changes to the same timer."""
+        current = self.sessions.get(user_id)
+        if stored is not None and current is not None \
+                and current.started_at == stored.started_at and current.version >= stored.version:
+            return
+        if stored is None and current is None:
+            return
+        # No row: finished on another worker. Another start time: a new timer. Newer version: changed elsewhere.
+        if stored is None:
+            self.sessions.pop(user_id, None)
+        else:
+            self.sessions[user_id] = stored
+        self.dirty.discard(user_id)
+        self._publish(user_id, stored)
+
+    async def get(self, db, user_id):
+        await self.load(db, user_id)
+        return self.sessions.get(user_id)
+
+    async def begin(self, db, user_id, category_id=None, note=None, planned_minutes=None):
+        """Raises LookupError if the category is not the user's, LiveConflict if a timer is already running."""
+        await self.load(db, user_id)
+        if user_id in self.sessions:
+            raise LiveConflict("A live session is already in progress")
+        if category_id is not None and not await db.run_sync(crud.user_owns_category, category_id, user_id):
+            raise LookupError("Category not found")
+        now = datetime.utcnow()
+        session = LiveSession("running", category_id, note, now, now, 0, planned_minutes, 1)
+        if not await db.run_sync(crud.begin_active_session, session.as_row(user_id)):
+            await self.load(db, user_id, fresh=True)  # started on another device or worker meanwhile
+            raise LiveConflict("A live session is already in progress")
+        await self._changed(user_id, session, checkpoint=False)
+        return session
+
+    async def pause(self, db, user_id):
+        await self.load(db, user_id)
+        session = self.sessions.get(user_id)
+        if session is None or session.state != "running":
+            raise LiveConflict("No running live session")
+        session = session.replace(state="paused", resumed_at=None, elapsed_seconds=session.elapsed(datetime.utcnow()))
+        await self._changed(user_id, session)
+        return session
+
+    async def resume(self, db, user_id):
+        await self.load(db, user_id)
+        session = self.sessions.get(user_id)
+        if session is None or session.state != "paused":
+            raise LiveConflict("No paused live session")
+        session = session.replace(state="running", resumed_at=datetime.utcnow())
+        await self._changed(user_id, session)
+        return session
+
+    async def finish(self, db, user_id, status="COMPLETED", note=None):
+        """Store the timer as a focus session (start_time = started_at, paused time excluded from the duration)."""
+        # Taken out of memory before the first await; the row delete below decides between workers
+        session = self.sessions.pop(user_id, None)
+        self.dirty.discard(user_id)
+        now = datetime.utcnow()
+        try:
+            # A checkpoint already under way may still write the old state; let it land
+            # first so the delete below is the last word
+            async with self._flushing:
+                pass
+            row = await db.run_sync(crud.take_active_session, user_id)
+            if row is None:  # finished on another worker, or never started
+                if session is not None:
+                    session = None
+                    self._publish(user_id, None)
+                raise LiveConflict("No live session")
+            stored = LiveSession.from_row(row)
+            if session is None or session.started_at != stored.started_at or session.version < stored.version:
+                session = stored  # paused or resumed on another worker
+            focus_session = await db.run_sync(
+                crud.finish_active_session,
+                user_id=user_id,
+                category_id=session.category_id,
+                note=note if note is not None else session.note,
+                start_time=session.started_at,
+                end_time=now,
+                duration_minutes=round(session.elapsed(now) / 60),
+                status=status
+            )
+        except BaseException:
+            if session is not None:  # the transaction rolls back, so the row is still there
+                self.sessions.setdefault(user_id, session)
+            raise
+        await self._changed(user_id, None, checkpoint=False)
+        return focus_session
+
+    async def _changed(self, user_id, session, checkpoint=True):
+        if session is None:
+            self.sessions.pop(user_id, None)
+        else:
+            self.sessions[user_id] = session
+        self.loaded.add(user_id)
+        if checkpoint:
+            self.dirty.add(user_id)
+        self._publish(user_id, session)
+        if self.fanout == "postgres":
+            await self._notify(user_id, session)
+
+    # --- Streams ---
+    def subscribe(self, user_id):
+        if len(self.streams[user_id]) >= LIVE_MAX_STREAMS_PER_USER:
+            raise TooManyStreams("Too many open live streams")
+        queue = asyncio.Queue(maxsize=LIVE_STREAM_QUEUE_SIZE)
+        self.streams[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        streams = self.streams.get(user_id)
+        if streams is not None:
+            streams.discard(queue)
+            if not streams:
+                del self.streams[user_id]
+
+    async def events(self, user_id, queue):
+        """The SSE body: reconnect delay and current state, then every change and heartbeat."""
+        try:
+            yield b"retry: %d\n" % RETRY_MS + _event(self.sessions.get(user_id), datetime.utcnow())
+            while True:
+                yield await queue.get()
+        finally:
+            self.unsubscribe(user_id, queue)
+
+    @staticmethod
+    def _put(queue, message):
+        if queue.full():
+            queue.get_nowait()  # slow reader: drop its oldest message
+        queue.put_nowait(message)
+
+    def _publish(self, user_id, session):
+        streams = self.streams.get(user_id)
+        if streams:
+            message = _event(session, datetime.utcnow())
+            for queue in streams:
+                self._put(queue, message)
+
+    # --- Checkpoints ---
+    async def flush(self):
+        """Write the paused and resumed timers to active_sessions in one transaction."""
+        if not self.dirty:
+            return 0
+        async with self._flushing:
+            users, self.dirty = self.dirty, set()
+            rows = [self.sessions[user_id].as_row(user_id) for user_id in users if user_id in self.sessions]
+            if not rows:
+                return 0
+            try:
+                async with database.AsyncSessionLocal() as db:
+                    await db.run_sync(crud.save_active_sessions, rows)
+            except BaseException:
+                self.dirty |= users  # retried on the next checkpoint
+                raise
+            self.checkpoints += 1
+            return len(users)
+
+    async def _checkpoint_loop(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                await self.flush()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.warning("Live timer checkpoint failed: %s", self.last_error)
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            for streams in self.streams.values():
+                for queue in streams:
+                    if not queue.full():
+                        queue.put_nowait(HEARTBEAT)
+
+    # --- Cross-worker fanout ---
+    async def _notify(self, user_id, session):
+        payload = serialization.dumps({
+            "origin": self.origin,
+            "user_id": user_id,
+            "session": session.as_row(None) if session is not None else None,
+        }).decode()
+        try:
+            async with database.async_engine.connect() as conn:
+                await conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": payload})
+                await conn.commit()
+        except Exception as e:  # this worker's clients are up to date; others catch up on their next read
+            logger.warning("Live timer notify failed: %s: %s", type(e).__name__, e)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        message = orjson.loads(payload)
+        if message["origin"] == self.origin:
+            return
+        user_id = UUID(message["user_id"])
+        session = LiveSession.from_message(message["session"]) if message["session"] is not None else None
+        if session is None:
+            self.sessions.pop(user_id, None)
+        else:
+            self.sessions[user_id] = session
+        self.loaded.add(user_id)
+        self.dirty.discard(user_id)  # the worker that made the change checkpoints it
+        self._publish(user_id, session)
+
+    async def _listen_loop(self):
+        while True:
+            lost = asyncio.Event()
+            try:
+                self._listener = await database.async_engine.connect()
+                raw = (await self._listener.get_raw_connection()).driver_connection
+                raw.add_termination_listener(lambda connection: lost.set())
+                await raw.add_listener(CHANNEL, self._on_notify)
+                # Changes made elsewhere while we were not listening
+                self.loaded.clear()
+                self.sessions = {user_id: self.sessions[user_id] for user_id in self.dirty if user_id in self.sessions}
+                self.loaded.update(self.sessions)
+                await lost.wait()
+                logger.warning("Live timer LISTEN connection lost; reconnecting")
+            except Exception as e:
+                logger.warning("Live timer LISTEN failed: %s: %s", type(e).__name__, e)
+            finally:
+                await self._close_listener()
+            await asyncio.sleep(LIVE_RECONNECT_INTERVAL)
+
+    async def _close_listener(self):
+        if self._listener is not None:
+            listener, self._listener = self._listener, None
+            try:
+                await listener.invalidate()  # never goes back to the pool with LISTEN still active
+            except Exception:
+                pass
+
+    # --- Lifecycle ---
+    async def _run(self, ready):
+        while not ready():
+            await asyncio.sleep(1)
+        loop = asyncio.get_running_loop()
+        self._tasks.append(loop.create_task(self._checkpoint_loop()))
+        if self.fanout == "postgres":
+            self._tasks.append(loop.create_task(self._listen_loop()))
+
+    def start(self, ready=lambda: True):
+        if not self._tasks:
+            loop = asyncio.get_running_loop()
+            self._tasks = [loop.create_task(self._heartbeat_loop()), loop.create_task(self._run(ready))]
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self._close_listener()
+        try:
+            await self.flush()  # don't lose the last few seconds of pauses and resumes
+        except Exception as e:
+            logger.warning("Final live timer checkpoint failed: %s: %s", type(e).__name__, e)
+
+    def stats(self):
+        return {
+            "sessions": len(self.sessions),
+            "streams": sum(len(streams) for streams in self.streams.values()),
+            "dirty": len(self.dirty),
+            "checkpoints": self.checkpoints,
+        }
+
+
+registry = Registry()
@@ -0,0 +1,67 @@
+"""
+Event-loop lag monitor.
+
+A background task sleeps for a fixed interval and measures how late it wakes up.
+Anything that blocks the loop (sync DB calls, CPU-bound work in an async def)
+shows up as lag; samples above LOOP_LAG_WARN_MS are logged as warnings.
+"""
+import asyncio
+import logging
+import os
+
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))  # seconds
+LOOP_LAG_WARN_MS = float(os.getenv("LOOP_LAG_WARN_MS", "100"))
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, warn_ms: float = LOOP_LAG_WARN_MS):
+        self.interval = interval
+        self.warn_ms = warn_ms
+        self.samples = 0
+        self.total_ms = 0.0
+        self.last_ms = 0.0
+        self.max_ms = 0.0
+        self.over_threshold = 0
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (loop.time() - started - self.interval) * 1000)
+
+            self.samples += 1
+            self.total_ms += lag_ms
+            self.last_ms = lag_ms
+            self.max_ms = max(self.max_ms, lag_ms)
+            if lag_ms > self.warn_ms:
+                self.over_threshold += 1
+                logger.warning("Event loop blocked for %.1f ms", lag_ms)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return {
+            "samples": self.samples,
+            "last_ms": self.last_ms,
+            "max_ms": self.max_ms,
+            "avg_ms": self.total_ms / self.samples if self.samples else 0.0,
+            "over_threshold": self.over_threshold,
+        }
+
+
+monitor = LoopLagMonitor()
@@ -1,28 +1,33 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from . import models, database
-from .routers import auth, categories, sessions, analytics
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response
+from . import database, loop_monitor, hashing, cache, health, metrics, query_budget, partitioning, live
+from .routers import auth, categories, sessions, analytics, sync, live as live_router
 
 import os
-import time
-from sqlalchemy.exc import OperationalError
-
-# Create tables automatically (Simple migration for MVP initial run)
-# Retry logic for DB connection
-max_retries = 5
-for i in range(max_retries):
-    try:
-        models.Base.metadata.create_all(bind=database.engine)
-        print("Database connected and tables created successfully.")
-        break
-    except OperationalError as e:
-        if i == max_retries - 1:
-            print("Failed to connect to the database after multiple retries.")
-            raise e
-        print(f"Database connection failed. Retrying in 3 seconds... ({i+1}/{max_retries})")
-        time.sleep(3)
-
-app = FastAPI(title="Flowstate API", version="0.1.0", root_path=os.getenv("ROOT_PATH", ""))
+
+# Nothing here touches the database: the schema is managed by Alembic migrations
+# (`alembic upgrade head`) and readiness is probed in the background (health.py),
+# so a cold start only pays for imports.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_monitor.monitor.start()
+    health.probe.start()
+    # Creates upcoming focus_sessions partitions once the database is up (no-op when unpartitioned)
+    partitioning.maintainer.start(ready=lambda: health.probe.ready)
+    # Live timer checkpoints, stream heartbeats and the cross-worker LISTEN
+    live.registry.start(ready=lambda: health.probe.ready)
+    yield
+    await live.registry.stop()
+    await partitioning.maintainer.stop()
+    await health.probe.stop()
+    await loop_monitor.monitor.stop()
+    hashing.shutdown()
+    await database.async_engine.dispose()
+
+app = FastAPI(title="Flowstate API", version="0.1.0", root_path=os.getenv("ROOT_PATH", ""), lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -32,12 +37,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compresses large responses (exports, session lists); responses that already
+# carry a Content-Encoding, like the pre-compressed dashboard, pass through untouched
+app.add_middleware(GZipMiddleware, minimum_size=cache.GZIP_MIN_SIZE, compresslevel=cache.GZIP_LEVEL)
+
+# Checks each request's SQL statement count against its router's declared budget
+app.add_middleware(query_budget.QueryBudgetMiddleware)
+
+# Added last so it is outermost: latency includes CORS and compression, and every
+# response (errors too) carries a Server-Timing header with its SQL time
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Include Routers
 app.include_router(auth.router)
 app.include_router(categories.router)
 app.include_router(sessions.router)
 app.include_router(analytics.router)
+app.include_router(sync.router)
+app.include_router(live_router.router)
 
-@app.get("/")
+# Service routes never touch the database (readiness reads the background probe's state)
+NO_QUERIES = Depends(query_budget.budget(0))
+
+@app.get("/", dependencies=[NO_QUERIES])
 def read_root():
     return {"message": "Welcome to Flowstate API"}
+
+@app.get("/health/live", dependencies=[NO_QUERIES])
+def liveness():
+    return {"status": "ok"}
+
+@app.get("/health/ready", dependencies=[NO_QUERIES])
+def readiness():
+    # 503 until the database is reachable and migrated
+    status = health.probe.status()
+    return JSONResponse(status, status_code=200 if health.probe.ready else 503)
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,242 @@
+"""
+Request and SQL instrumentation, exported at /metrics in the Prometheus text format.
+
+MetricsMiddleware times every HTTP request and labels it by route template (not raw
+path, so label cardinality stays bounded). SQLAlchemy cursor events on every Engine
+(the async engine included, through its sync_engine) add each statement's time to
+the current request's RequestStats, found through a context variable; the totals go
+into per-route counters and into a Server-Timing header:
+    Server-Timing: db;dur=3.2;desc="4 queries", app;dur=11.7
+
+The overhead per request is a context variable lookup and a few perf_counter calls
+per statement. Values are per worker process: with several uvicorn workers,
+Prometheus sees one series per scraped process.
+"""
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+from . import auth, database, hashing, live, loop_monitor
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # seconds
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+# --- Registry ---
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1.0):
+        with self._lock:
+            self._values[labels] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in self._values.items():
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [count per bucket (not cumulative)..., +Inf count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            else:
+                row[len(self.buckets)] += 1
+            row[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, row in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), row[:-1]):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {row[-1]}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+def _family(name, kind, documentation, samples):
+    """Lines for a metric whose values are read at scrape time; samples are (labels dict, value)."""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(labels.keys(), labels.values())} {value}")
+    return lines
+
+
+REQUESTS = Counter("flowstate_http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+LATENCY = Histogram("flowstate_http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+SQL_STATEMENTS = Histogram(
+    "flowstate_http_request_sql_statements", "SQL statements executed per HTTP request.",
+    ("method", "route"), buckets=STATEMENT_BUCKETS
+)
+SQL_SECONDS = Counter("flowstate_sql_duration_seconds_total", "Time spent in SQL statements, by route.", ("method", "route"))
+
+
+# --- Per-request SQL accounting ---
+class RequestStats:
+    __slots__ = ("statements", "sql_seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.sql_seconds = 0.0
+
+
+# SQLAlchemy propagates the context into the greenlets that run AsyncSession.run_sync,
+# so statements issued there land on the request that issued them
+current_request = ContextVar("flowstate_request_stats", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["metrics_started"].pop()
+    stats = current_request.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.sql_seconds += elapsed
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute; drop its start time
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("metrics_started"):
+        conn.info["metrics_started"].pop()
+
+
+# --- Middleware ---
+class MetricsMiddleware:
+    """Pure ASGI middleware: no per-request task or body buffering, streaming responses pass straight through."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                app_ms = (time.perf_counter() - started) * 1000
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Server-Timing",
+                    f'db;dur={stats.sql_seconds * 1000:.1f};desc="{stats.statements} queries", app;dur={app_ms:.1f}'
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_request.reset(token)
+            route = scope.get("route")
+            # Unmatched paths share one label so scanners cannot blow up the series count
+            labels = (scope["method"], route.path if route is not None else "unmatched")
+            LATENCY.observe(labels, time.perf_counter() - started)
+            REQUESTS.inc(labels + (str(status),))
+            SQL_STATEMENTS.observe(labels, stats.statements)
+            SQL_SECONDS.inc(labels, stats.sql_seconds)
+
+
+# --- Exposition ---
+def _runtime_metrics():
+    lines = []
+
+    pools = database.pool_stats()
+    for key, kind, documentation in (
+        ("checkouts", "counter", "Connection pool checkouts."),
+        ("timeouts", "counter", "Checkouts that gave up waiting for a connection."),
+        ("avg_wait_ms", "gauge", "Average checkout wait in milliseconds."),
+        ("max_wait_ms", "gauge", "Longest checkout wait in milliseconds."),
+        ("checked_out", "gauge", "Connections currently checked out."),
+        ("capacity", "gauge", "Pool size plus max overflow."),
+        ("saturation", "gauge", "Checked out connections / capacity."),
+    ):
+        name = f"flowstate_db_pool_{key}" + ("_total" if kind == "counter" else "")
+        samples = [({"engine": engine, "profile": s["profile"]}, s[key]) for engine, s in pools.items() if key in s]
+        lines += _family(name, kind, documentation, samples)
+
+    lag = loop_monitor.monitor.stats()
+    lines += _family("flowstate_event_loop_lag_ms", "gauge", "Event loop lag of the last sample.", [({}, lag["last_ms"])])
+    lines += _family("flowstate_event_loop_lag_max_ms", "gauge", "Largest event loop lag seen.", [({}, lag["max_ms"])])
+    lines += _family("flowstate_event_loop_blocked_total", "counter", "Lag samples above LOOP_LAG_WARN_MS.",
+                     [({}, lag["over_threshold"])])
+
+    identity = auth.identity_cache_stats()
+    lines += _family("flowstate_identity_cache_lookups_total", "counter", "Verified-token cache lookups.",
+                     [({"result": "hit"}, identity["hits"]), ({"result": "miss"}, identity["misses"])])
+    lines += _family("flowstate_identity_cache_entries", "gauge", "Cached identities.", [({}, identity["size"])])
+
+    bcrypt = hashing.pool_stats()
+    lines += _family("flowstate_bcrypt_pending", "gauge", "Hashes queued or running.", [({}, bcrypt["pending"])])
+    lines += _family("flowstate_bcrypt_max_pending", "gauge", "BCRYPT_MAX_PENDING.", [({}, bcrypt["max_pending"])])
+    lines += _family("flowstate_bcrypt_hashes_total", "counter", "Hash jobs by outcome.",
+                     [({"result": "completed"}, bcrypt["completed"]), ({"result": "rejected"}, bcrypt["rejected"])])
+    lines += _family("flowstate_bcrypt_avg_ms", "gauge", "Average time per hash job.", [({}, bcrypt["avg_ms"])])
+
+    timers = live.registry.stats()
+    lines += _family("flowstate_live_sessions", "gauge", "Live timers held by this worker.", [({}, timers["sessions"])])
+    lines += _family("flowstate_live_streams", "gauge", "Open live timer event streams.", [({}, timers["streams"])])
+    lines += _family("flowstate_live_checkpoints_total", "counter", "Live timer checkpoints written.", [({}, timers["checkpoints"])])
+    return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in (REQUESTS, LATENCY, SQL_STATEMENTS, SQL_SECONDS):
+        lines += metric.render()
+    lines += _runtime_metrics()
+    return "\n".join(lines) + "\n"
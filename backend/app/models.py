@@ -1,11 +1,16 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Enum, Text
+from sqlalchemy import BigInteger, Column, Integer, String, ForeignKey, DateTime, Date, Enum, Text, Index, text
 from sqlalchemy.orm import relationship
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, UUID
 import uuid
 import enum
 from datetime import datetime
 from .database import Base
 
+# Change version for GET /sync: the id of the transaction that last wrote the row.
+# Set by the database on insert, and by SQLAlchemy on every ORM or Core update()
+# that does not set it (raw SQL updates must set it themselves).
+CHANGE_VERSION = text("pg_current_xact_id()::text::bigint")
+
 class SessionStatus(str, enum.Enum):
     COMPLETED = "COMPLETED"
     ABORTED = "ABORTED"
@@ -29,23 +34,188 @@ class Category(Base):
     name = Column(String, index=True)
     color_code = Column(String, default="#000000")
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
+    version = Column(BigInteger, nullable=False, server_default=CHANGE_VERSION, onupdate=CHANGE_VERSION)
 
     # Relationships
     user = relationship("User", back_populates="categories")
     focus_sessions = relationship("FocusSession", back_populates="category")
 
+    __table_args__ = (
+        Index("ix_categories_user_version", "user_id", "version"),
+    )
+
 class FocusSession(Base):
     __tablename__ = "focus_sessions"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
     category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
-    start_time = Column(DateTime, default=datetime.utcnow)
+    start_time = Column(DateTime, default=datetime.utcnow, nullable=False) # Partition key when partitioned
     end_time = Column(DateTime, nullable=True)
     duration_minutes = Column(Integer)
     status = Column(String) # Enum as String for simplicity in MVP, or use Enum type
     note = Column(Text, nullable=True)
+    idempotency_key = Column(String, nullable=True) # Client-supplied, for POST /sessions/batch retries
+    version = Column(BigInteger, nullable=False, server_default=CHANGE_VERSION, onupdate=CHANGE_VERSION)
 
     # Relationships
     user = relationship("User", back_populates="focus_sessions")
     category = relationship("Category", back_populates="focus_sessions")
+
+    # Kept in sync with alembic/versions (see 0002_focus_session_indexes)
+    __table_args__ = (
+        # Analytics: user + date range over COMPLETED sessions, answered from the index alone
+        Index(
+            "ix_focus_sessions_completed_user_start",
+            "user_id", "start_time",
+            postgresql_include=["duration_minutes", "category_id"],
+            postgresql_where=text("status = 'COMPLETED'"),
+        ),
+        # Session list / recent sessions (all statuses); id makes it the keyset for cursor pagination
+        Index("ix_focus_sessions_user_start_id", "user_id", "start_time", "id"),
+        Index("ix_focus_sessions_category_id", "category_id"),
+        # GET /sync: a user's changes since a version, in (version, id) keyset order
+        Index("ix_focus_sessions_user_version_id", "user_id", "version", "id"),
+        # start_time is part of the key so the index can exist on a partitioned table
+        # (see partitioning.py); a retried item always repeats its start_time
+        Index(
+            "ux_focus_sessions_user_idempotency_key",
+            "user_id", "idempotency_key", "start_time",
+            unique=True,
+            postgresql_where=text("idempotency_key IS NOT NULL"),
+        ),
+    )
+
+class DailyFocusRollup(Base):
+    """Per user / category / day totals of COMPLETED sessions, maintained by crud (see rollup.py)."""
+    __tablename__ = "daily_focus_rollup"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
+    day = Column(Date, nullable=False)
+    session_count = Column(Integer, nullable=False, default=0)
+    total_minutes = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Upsert target; uncategorized sessions (category_id NULL) share one row per day
+        Index(
+            "ux_daily_focus_rollup_user_day_category",
+            "user_id", "day", "category_id",
+            unique=True,
+            postgresql_nulls_not_distinct=True,
+        ),
+    )
+
+class FocusSessionArchive(Base):
+    """
+    Daily totals of COMPLETED sessions from focus_sessions partitions that were archived
+    (detached, see partitioning.py). Same shape as daily_focus_rollup; rollup.rebuild
+    and rollup.check count these alongside the live sessions.
+    """
+    __tablename__ = "focus_session_archive"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
+    day = Column(Date, nullable=False)
+    session_count = Column(Integer, nullable=False, default=0)
+    total_minutes = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index(
+            "ux_focus_session_archive_user_day_category",
+            "user_id", "day", "category_id",
+            unique=True,
+            postgresql_nulls_not_distinct=True,
+        ),
+    )
+
+class ActiveSession(Base):
+    """
+    Checkpoint of a user's running or paused live timer (see live.py). The in-memory
+    registry is authoritative; rows are written every LIVE_CHECKPOINT_INTERVAL seconds
+    and reloaded after a restart. No foreign key on category_id: the category is
+    checked again when the timer is finished.
+    """
+    __tablename__ = "active_sessions"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    category_id = Column(Integer, nullable=True)
+    note = Column(Text, nullable=True)
+    state = Column(String, nullable=False) # running / paused
+    started_at = Column(DateTime, nullable=False)
+    resumed_at = Column(DateTime, nullable=True) # Start of the current running stretch; NULL while paused
+    elapsed_seconds = Column(Integer, nullable=False, default=0) # Running time before resumed_at
+    planned_minutes = Column(Integer, nullable=True)
+    version = Column(Integer, nullable=False, default=1)
+
+class SyncTombstone(Base):
+    """A deleted category or session, so GET /sync can tell clients to drop their copy."""
+    __tablename__ = "sync_tombstones"
+
+    id = Column(BigInteger, primary_key=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    entity = Column(String, nullable=False) # category / session
+    entity_id = Column(String, nullable=False) # Category id or session UUID, as text
+    version = Column(BigInteger, nullable=False, server_default=CHANGE_VERSION)
+
+    __table_args__ = (
+        Index("ix_sync_tombstones_user_version", "user_id", "version"),
+    )
+
+class WeeklyReport(Base):
+    """One user's summary of one ISO week (Monday to Sunday, UTC), written by reports.py."""
+    __tablename__ = "weekly_reports"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    week_start = Column(Date, primary_key=True) # Monday
+    total_minutes = Column(Integer, nullable=False)
+    session_count = Column(Integer, nullable=False)
+    minutes_delta = Column(Integer, nullable=False) # Against the week before
+    sessions_delta = Column(Integer, nullable=False)
+    weekday_minutes = Column(ARRAY(Integer), nullable=False) # Monday .. Sunday
+    categories = Column(JSONB, nullable=False) # [{category_id, name, color, minutes, sessions}], most minutes first
+    generated_at = Column(DateTime, nullable=False)
+
+class WeeklyReportChunk(Base):
+    """
+    Work plan of a weekly report run: one row per range of user ids, [first_user_id,
+    end_user_id), NULL for the open ends of the first and last chunk. done_at is set
+    in the same transaction that writes the chunk's reports, so a run resumes by
+    picking up the rows where it is still NULL.
+    """
+    __tablename__ = "weekly_report_chunks"
+
+    week_start = Column(Date, primary_key=True)
+    chunk = Column(Integer, primary_key=True)
+    first_user_id = Column(UUID(as_uuid=True), nullable=True)
+    end_user_id = Column(UUID(as_uuid=True), nullable=True)
+    done_at = Column(DateTime, nullable=True)
+    reports = Column(Integer, nullable=True)
+
+class FocusStreak(Base):
+    """
+    Runs of consecutive days with at least one COMPLETED session, maintained by crud
+    (see streaks.py): one row per user for all sessions (category_id NULL) and one per
+    category. current_length is the run ending on last_day; whether it is still going
+    depends on today, so readers check last_day.
+    """
+    __tablename__ = "focus_streaks"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
+    last_day = Column(Date, nullable=True) # Latest day with a session; NULL once none are left
+    current_length = Column(Integer, nullable=False, default=0)
+    longest_length = Column(Integer, nullable=False, default=0)
+    longest_end = Column(Date, nullable=True) # Last day of the longest run (the latest one on a tie)
+
+    __table_args__ = (
+        Index(
+            "ux_focus_streaks_user_category",
+            "user_id", "category_id",
+            unique=True,
+            postgresql_nulls_not_distinct=True,
+        ),
+    )
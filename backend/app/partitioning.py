@@ -0,0 +1,291 @@
+"""
+Optional monthly range partitioning of focus_sessions on start_time.
+
+A fresh install keeps focus_sessions as one plain table. `enable` converts it, in one
+transaction, into a partitioned table with one partition per calendar month (UTC)
+and a DEFAULT partition for anything outside them; the primary key becomes
+(id, start_time) and the indexes in models.py are recreated on the parent.
+Queries bounded on start_time (exports, the heatmap window, cursor pages) then only
+scan the months they need, and ORDER BY start_time DESC LIMIT n reads the newest
+partitions first. Analytics totals come from daily_focus_rollup and are unaffected.
+
+Partitions for the next PARTITION_MONTHS_AHEAD months are created by `maintain`,
+which the app also runs in the background every PARTITION_MAINTENANCE_INTERVAL
+seconds (a no-op while the table is not partitioned).
+
+`archive` retires old months: each partition older than --older-than-months has its
+daily COMPLETED totals added to focus_session_archive, then it is detached (and
+dropped with --drop; a detached copy keeps no foreign keys). Its sessions leave the
+session list and exports; the rollup and lifetime stats keep counting them, and
+rollup.rebuild reads them back from the archive table.
+
+Command line (run from backend/):
+    python -m app.partitioning status
+    python -m app.partitioning enable [--months-ahead 3]
+    python -m app.partitioning maintain [--months-ahead 3]
+    python -m app.partitioning archive --older-than-months 24 [--drop]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+import sys
+from datetime import date, datetime
+
+from sqlalchemy import text
+
+from . import database, models
+
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_MAINTENANCE_INTERVAL = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "21600"))  # seconds
+PARTITION_LOCK_TIMEOUT = os.getenv("PARTITION_LOCK_TIMEOUT", "5s")  # DDL gives up instead of queueing requests
+
+TABLE = "focus_sessions"
+DEFAULT_PARTITION = f"{TABLE}_pdefault"
+PARTITION_NAME = re.compile(rf"^{TABLE}_p(\d{{6}}|default)$")
+MAINTENANCE_LOCK = 0x466F6375  # pg_advisory_xact_lock key: one maintainer at a time across workers
+
+logger = logging.getLogger(__name__)
+
+
+def is_partition_name(name: str) -> bool:
+    """True for partitions (attached or detached) created here; alembic/env.py skips them."""
+    return PARTITION_NAME.match(name) is not None
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _partition_name(month: date) -> str:
+    return f"{TABLE}_p{month:%Y%m}"
+
+
+def is_partitioned(conn) -> bool:
+    return conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table))"
+    ), {"table": TABLE}).scalar()
+
+
+def partitions(conn):
+    """Attached monthly partitions as {month: name}; the DEFAULT partition is not included."""
+    names = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:table)"
+    ), {"table": TABLE}).scalars()
+    months = {}
+    for name in names:
+        suffix = PARTITION_NAME.match(name).group(1)
+        if suffix != "default":
+            months[date(int(suffix[:4]), int(suffix[4:]), 1)] = name
+    return months
+
+
+def create_partition(conn, month: date):
+    """
+    Partition for one month. Rows for that month already in the DEFAULT partition are
+    moved into it (Postgres refuses to create the partition otherwise).
+    """
+    name, start, end = _partition_name(month), month, _add_months(month, 1)
+    bounds = {"start": start, "end": end}
+    stranded = conn.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE start_time >= :start AND start_time < :end)"
+    ), bounds).scalar()
+    if not stranded:
+        conn.execute(text(f"CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM ('{start}') TO ('{end}')"))
+        return name
+
+    conn.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}"))
+    conn.execute(text(f"CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM ('{start}') TO ('{end}')"))
+    conn.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE start_time >= :start AND start_time < :end RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), bounds)
+    conn.execute(text(f"ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+    return name
+
+
+def ensure_partitions(conn, months_ahead: int = PARTITION_MONTHS_AHEAD):
+    """Create any missing partitions from the current month to months_ahead. Returns the names created."""
+    if not is_partitioned(conn):
+        return []
+    conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MAINTENANCE_LOCK})
+    conn.execute(text(f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'"))
+    conn.execute(text("SET LOCAL statement_timeout = 0"))
+    existing = partitions(conn)
+    this_month = datetime.utcnow().date().replace(day=1)
+    created = []
+    for offset in range(months_ahead + 1):
+        month = _add_months(this_month, offset)
+        if month not in existing:
+            created.append(create_partition(conn, month))
+    return created
+
+
+def enable(conn, months_ahead: int = PARTITION_MONTHS_AHEAD):
+    """
+    Convert the plain focus_sessions table into a partitioned one, copying every row.
+    Holds an ACCESS EXCLUSIVE lock on focus_sessions until the transaction commits:
+    run it in a maintenance window. Returns the number of partitions created.
+    """
+    if is_partitioned(conn):
+        raise RuntimeError(f"{TABLE} is already partitioned")
+
+    conn.execute(text(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE"))
+    first = conn.execute(text(f"SELECT min(start_time) FROM {TABLE}")).scalar()
+    this_month = datetime.utcnow().date().replace(day=1)
+    first_month = first.date().replace(day=1) if first else this_month
+
+    conn.execute(text(f"ALTER TABLE {TABLE} RENAME TO {TABLE}_unpartitioned"))
+    conn.execute(text(
+        f"CREATE TABLE {TABLE} (LIKE {TABLE}_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (start_time)"
+    ))
+    conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT"))
+    count = 0
+    month = first_month
+    while month <= _add_months(this_month, months_ahead):
+        conn.execute(text(
+            f"CREATE TABLE {_partition_name(month)} PARTITION OF {TABLE} "
+            f"FOR VALUES FROM ('{month}') TO ('{_add_months(month, 1)}')"
+        ))
+        month = _add_months(month, 1)
+        count += 1
+
+    conn.execute(text(f"INSERT INTO {TABLE} SELECT * FROM {TABLE}_unpartitioned"))
+    conn.execute(text(f"DROP TABLE {TABLE}_unpartitioned"))
+
+    # Keys and indexes after the copy: one build per partition instead of per-row maintenance
+    conn.execute(text(f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, start_time)"))
+    conn.execute(text(f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_user_id_fkey FOREIGN KEY (user_id) REFERENCES users (id)"))
+    conn.execute(text(f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_category_id_fkey FOREIGN KEY (category_id) REFERENCES categories (id)"))
+    for index in models.FocusSession.__table__.indexes:
+        index.create(conn)
+    conn.execute(text(f"ANALYZE {TABLE}"))
+    return count
+
+
+def archive(conn, older_than_months: int, drop: bool = False):
+    """
+    Move the daily totals of partitions that ended more than older_than_months ago into
+    focus_session_archive and detach (or drop) them. Returns the partition names.
+    """
+    if not is_partitioned(conn):
+        raise RuntimeError(f"{TABLE} is not partitioned; run `python -m app.partitioning enable` first")
+    conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MAINTENANCE_LOCK})
+    conn.execute(text("SET LOCAL statement_timeout = 0"))
+
+    cutoff = _add_months(datetime.utcnow().date().replace(day=1), -older_than_months)
+    archived = []
+    for month, name in sorted(partitions(conn).items()):
+        if month >= cutoff:
+            break
+        conn.execute(text(
+            "INSERT INTO focus_session_archive (user_id, category_id, day, session_count, total_minutes) "
+            f"SELECT user_id, category_id, date(start_time), count(*), coalesce(sum(duration_minutes), 0) "
+            f"FROM {name} WHERE status = 'COMPLETED' GROUP BY user_id, category_id, date(start_time) "
+            "ON CONFLICT (user_id, day, category_id) DO UPDATE SET "
+            "session_count = focus_session_archive.session_count + excluded.session_count, "
+            "total_minutes = focus_session_archive.total_minutes + excluded.total_minutes"
+        ))
+        conn.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+        if drop:
+            conn.execute(text(f"DROP TABLE {name}"))
+        else:
+            # A detached partition is an inert copy: it must not block deleting categories or users
+            conn.execute(text(
+                f"ALTER TABLE {name} DROP CONSTRAINT {TABLE}_category_id_fkey, DROP CONSTRAINT {TABLE}_user_id_fkey"
+            ))
+        archived.append(name)
+    return archived
+
+
+def status(conn):
+    """(name, bounds, estimated rows) per attached partition, oldest first."""
+    return conn.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint "
+        "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:table) ORDER BY c.relname"
+    ), {"table": TABLE}).all()
+
+
+class PartitionMaintainer:
+    """Runs ensure_partitions in the background: once the database is ready, then every interval."""
+
+    def __init__(self, interval: float = PARTITION_MAINTENANCE_INTERVAL):
+        self.interval = interval
+        self.last_run = None
+        self.last_error = None
+        self._task = None
+
+    async def run_once(self):
+        async with database.async_engine.begin() as conn:
+            created = await conn.run_sync(ensure_partitions)
+        self.last_run = datetime.utcnow()
+        if created:
+            logger.info("Created focus_sessions partitions: %s", ", ".join(created))
+        return created
+
+    async def _run(self, ready):
+        while not ready():
+            await asyncio.sleep(1)
+        while True:
+            try:
+                await self.run_once()
+                self.last_error = None
+            except Exception as e:  # retried next interval; the DEFAULT partition catches rows meanwhile
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.warning("Partition maintenance failed: %s", self.last_error)
+            await asyncio.sleep(self.interval)
+
+    def start(self, ready=lambda: True):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run(ready))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+maintainer = PartitionMaintainer()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.partitioning", description="Partition focus_sessions by month")
+    parser.add_argument("command", choices=["status", "enable", "maintain", "archive"])
+    parser.add_argument("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD)
+    parser.add_argument("--older-than-months", type=int, help="archive: partitions that ended before this many months ago")
+    parser.add_argument("--drop", action="store_true", help="archive: drop the detached partitions")
+    args = parser.parse_args(argv)
+
+    if args.command == "archive" and args.older_than_months is None:
+        parser.error("archive requires --older-than-months")
+
+    with database.engine.begin() as conn:
+        if args.command == "enable":
+            count = enable(conn, args.months_ahead)
+            print(f"{TABLE} is now partitioned: {count} monthly partitions + {DEFAULT_PARTITION}.")
+        elif args.command == "maintain":
+            created = ensure_partitions(conn, args.months_ahead)
+            print(f"Created: {', '.join(created)}" if created else "No partitions needed.")
+        elif args.command == "archive":
+            archived = archive(conn, args.older_than_months, args.drop)
+            action = "Archived and dropped" if args.drop else "Archived and detached"
+            print(f"{action}: {', '.join(archived)}" if archived else "Nothing to archive.")
+        else:
+            if not is_partitioned(conn):
+                print(f"{TABLE} is not partitioned.")
+                return 0
+            for name, bounds, rows in status(conn):
+                print(f"  {name:<28} {bounds:<70} ~{max(rows, 0)} rows")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
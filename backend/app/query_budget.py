@@ -0,0 +1,159 @@
+"""
+SQL query budgets: how many statements a request (or a block of code) may issue.
+
+Each router declares a budget for its routes, and a route can declare its own to
+override it:
+    router = APIRouter(prefix="/sessions", dependencies=[Depends(query_budget.budget(3))])
+QueryBudgetMiddleware counts every statement sent through any engine while the
+request is handled (dependencies and streamed bodies included) and checks the count
+against the declared budget when the response is finished. Statements of the same
+shape (same SQL once literals are collapsed) repeated QUERY_REPEAT_LIMIT times or
+more are reported as a likely N+1, e.g. a lazy-loaded relationship read in a loop.
+
+With QUERY_BUDGET_STRICT=1 (tests, scripts/verify_query_budgets.py) a violation
+raises QueryBudgetExceeded; otherwise it is logged as a warning.
+
+Outside a request, query_budget works as a context manager or decorator:
+    with query_budget(2) as log:
+        crud.get_focus_session_rows(db, user_id)
+    log.count, log.repeated()
+"""
+import logging
+import os
+import re
+from collections import Counter
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "0") == "1"
+QUERY_REPEAT_LIMIT = int(os.getenv("QUERY_REPEAT_LIMIT", "5"))
+
+# Numeric literals and expanded IN lists vary between otherwise identical statements
+_LITERALS = re.compile(r"\b\d+\b|'[^']*'")
+_IN_LISTS = re.compile(r"IN \([^()]*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    shape = _LITERALS.sub("?", statement)
+    shape = _IN_LISTS.sub("IN (?)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised in strict mode when a request or block issues more statements than its budget."""
+
+
+class QueryLog:
+    """Statements issued inside one request or query_budget block."""
+
+    def __init__(self, budget=None, label="block", repeat_limit=None):
+        self.budget = budget
+        self.label = label
+        self.repeat_limit = repeat_limit
+        self.count = 0
+        self.statements = Counter()
+
+    def record(self, statement):
+        self.count += 1
+        self.statements[statement] += 1
+
+    def repeated(self, limit=None):
+        """(shape, times) for statement shapes issued at least `limit` times, most frequent first."""
+        limit = limit or self.repeat_limit or QUERY_REPEAT_LIMIT
+        shapes = Counter()
+        for statement, times in self.statements.items():
+            shapes[statement_shape(statement)] += times
+        return [(shape, times) for shape, times in shapes.most_common() if times >= limit]
+
+    def problems(self):
+        problems = []
+        if self.budget is not None and self.count > self.budget:
+            problems.append(f"{self.label}: {self.count} statements, budget is {self.budget}")
+        for shape, times in self.repeated():
+            problems.append(f"{self.label}: possible N+1, {times}x {shape[:200]}")
+        return problems
+
+    def check(self, strict=None):
+        problems = self.problems()
+        if not problems:
+            return
+        if QUERY_BUDGET_STRICT if strict is None else strict:
+            raise QueryBudgetExceeded("; ".join(problems))
+        for problem in problems:
+            logger.warning("Query budget: %s", problem)
+
+
+# The innermost active log; SQLAlchemy carries it into run_sync greenlets
+current_log = ContextVar("flowstate_query_log", default=None)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    log = current_log.get()
+    if log is not None:
+        log.record(statement)
+
+
+class query_budget(ContextDecorator):
+    """Counts the statements issued inside the block and checks them against `limit` on exit."""
+
+    def __init__(self, limit=None, strict=None, label="block"):
+        self.limit = limit
+        self.strict = strict
+        self.label = label
+        self._active = []  # (log, token) per nested use of the same decorator
+
+    def __enter__(self):
+        log = QueryLog(self.limit, self.label)
+        self._active.append((log, current_log.set(log)))
+        return log
+
+    def __exit__(self, exc_type, exc, tb):
+        log, token = self._active.pop()
+        current_log.reset(token)
+        if exc_type is None:
+            log.check(self.strict)
+        return False
+
+
+def budget(limit: int, repeat_limit: int = None):
+    """
+    FastAPI dependency declaring the statement budget of a router or route (the route's wins).
+    repeat_limit raises the N+1 threshold for routes that repeat a statement on purpose,
+    e.g. one INSERT per chunk of a batch.
+    """
+    async def declare_query_budget():
+        log = current_log.get()
+        if log is not None:
+            log.budget = limit
+            log.repeat_limit = repeat_limit
+    return declare_query_budget
+
+
+class QueryBudgetMiddleware:
+    """Gives each HTTP request its own QueryLog and checks it once the response is complete."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        log = QueryLog()
+        token = current_log.set(log)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_log.reset(token)
+        route = scope.get("route")
+        if route is not None:
+            log.label = f"{scope['method']} {route.path}"
+            log.check()
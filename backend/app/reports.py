@@ -0,0 +1,280 @@
+"""
+Batch weekly reports for every user.
+
+A run for one ISO week (Monday to Sunday, UTC) first writes a plan to
+weekly_report_chunks: the users split into ranges of --chunk-users ids. The ranges
+are contiguous and the first and last are open-ended, so users who sign up while a
+run is under way, or before it is resumed, still get a report. Each chunk
+is then one INSERT ... SELECT over daily_focus_rollup that computes, for all users
+of the range at once, the week's totals, the split per category, the minutes per
+weekday and the change against the week before, and upserts them into
+weekly_reports. The chunk is marked done in the same transaction.
+
+Chunks run on a pool of --workers processes (REPORT_WORKERS). A worker claims its
+chunk with FOR UPDATE SKIP LOCKED, so an interrupted run is resumed by running the
+same command again, and two runs of the same week never compute a chunk twice.
+Users with no sessions that week still get a report, with zeros.
+
+Command line (run from backend/):
+    python -m app.reports run [--week 2026-10-05] [--chunk-users 1000] [--workers 4] [--restart]
+    python -m app.reports status [--week 2026-10-05]
+Without --week, the last complete week.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Integer, case, cast, func, literal, select, update
+from sqlalchemy.dialects.postgresql import JSONB, aggregate_order_by, array, insert
+from sqlalchemy.orm import Session
+
+from . import database, models
+
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+REPORT_CHUNK_USERS = int(os.getenv("REPORT_CHUNK_USERS", "1000"))
+
+Rollup = models.DailyFocusRollup
+Report = models.WeeklyReport
+Chunk = models.WeeklyReportChunk
+
+
+def week_start_of(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def last_complete_week() -> date:
+    return week_start_of(datetime.utcnow().date()) - timedelta(days=7)
+
+
+# --- Plan ---
+def plan(db: Session, week_start: date, chunk_users: int = REPORT_CHUNK_USERS):
+    """Split the users into id ranges for the week, unless a plan exists. Returns the number of chunks."""
+    existing = db.query(func.count()).select_from(Chunk).filter(Chunk.week_start == week_start).scalar()
+    if existing:
+        return existing
+    numbered = select(
+        models.User.id,
+        (func.row_number().over(order_by=models.User.id) - 1).label("position")
+    ).subquery("numbered")
+    # Every chunk_users-th id starts a chunk, which ends where the next one starts
+    starts = select(
+        numbered.c.id, (numbered.c.position // chunk_users).label("chunk")
+    ).where(numbered.c.position % chunk_users == 0).subquery("starts")
+    result = db.execute(insert(Chunk).from_select(
+        ["week_start", "chunk", "first_user_id", "end_user_id"],
+        select(
+            literal(week_start),
+            starts.c.chunk,
+            case((starts.c.chunk == 0, None), else_=starts.c.id),
+            func.lead(starts.c.id).over(order_by=starts.c.chunk)
+        )
+    ).on_conflict_do_nothing())  # a concurrent run planned the same week
+    db.commit()
+    return result.rowcount or db.query(func.count()).select_from(Chunk).filter(Chunk.week_start == week_start).scalar()
+
+
+def restart(db: Session, week_start: date):
+    """Forget the week's plan, so the next run recomputes every report."""
+    db.execute(Chunk.__table__.delete().where(Chunk.week_start == week_start))
+    db.commit()
+
+
+# --- One chunk ---
+def _in_range(column, first_user_id, end_user_id):
+    """column in [first_user_id, end_user_id); None leaves that end open."""
+    conditions = []
+    if first_user_id is not None:
+        conditions.append(column >= first_user_id)
+    if end_user_id is not None:
+        conditions.append(column < end_user_id)
+    return conditions
+
+
+def report_statement(week_start: date, first_user_id, end_user_id):
+    """The upsert of every weekly report for users in [first_user_id, end_user_id), in one statement."""
+    week_end = week_start + timedelta(days=7)
+    previous = week_start - timedelta(days=7)
+    in_chunk = _in_range(Rollup.user_id, first_user_id, end_user_id)
+    this_week = Rollup.day >= week_start
+
+    # Both weeks in one pass; per-weekday sums as FILTERed aggregates
+    totals = select(
+        Rollup.user_id,
+        func.sum(Rollup.total_minutes).filter(this_week).label("minutes"),
+        func.sum(Rollup.session_count).filter(this_week).label("sessions"),
+        func.sum(Rollup.total_minutes).filter(Rollup.day < week_start).label("previous_minutes"),
+        func.sum(Rollup.session_count).filter(Rollup.day < week_start).label("previous_sessions"),
+        *[
+            func.sum(Rollup.total_minutes).filter(Rollup.day == week_start + timedelta(days=i)).label(f"day{i}")
+            for i in range(7)
+        ]
+    ).where(*in_chunk, Rollup.day >= previous, Rollup.day < week_end).group_by(Rollup.user_id).cte("totals")
+
+    per_category = select(
+        Rollup.user_id,
+        Rollup.category_id,
+        func.sum(Rollup.total_minutes).label("minutes"),
+        func.sum(Rollup.session_count).label("sessions")
+    ).where(*in_chunk, this_week, Rollup.day < week_end).group_by(Rollup.user_id, Rollup.category_id).cte("per_category")
+
+    categories = select(
+        per_category.c.user_id,
+        func.jsonb_agg(aggregate_order_by(
+            func.jsonb_build_object(
+                "category_id", per_category.c.category_id,
+                "name", models.Category.name,
+                "color", models.Category.color_code,
+                "minutes", per_category.c.minutes,
+                "sessions", per_category.c.sessions
+            ),
+            per_category.c.minutes.desc(), per_category.c.category_id
+        )).label("categories")
+    ).select_from(
+        per_category.outerjoin(models.Category, models.Category.id == per_category.c.category_id)
+    ).group_by(per_category.c.user_id).cte("categories")
+
+    def zero(column):
+        return cast(func.coalesce(column, 0), Integer)
+
+    users = models.User
+    source = select(
+        users.id,
+        literal(week_start),
+        zero(totals.c.minutes),
+        zero(totals.c.sessions),
+        zero(totals.c.minutes) - zero(totals.c.previous_minutes),
+        zero(totals.c.sessions) - zero(totals.c.previous_sessions),
+        array([zero(totals.c[f"day{i}"]) for i in range(7)]),
+        func.coalesce(categories.c.categories, cast(literal("[]"), JSONB)),
+        literal(datetime.utcnow())
+    ).select_from(
+        users.__table__
+        .outerjoin(totals, totals.c.user_id == users.id)
+        .outerjoin(categories, categories.c.user_id == users.id)
+    ).where(*_in_range(users.id, first_user_id, end_user_id))
+
+    columns = ["user_id", "week_start", "total_minutes", "session_count", "minutes_delta", "sessions_delta",
+               "weekday_minutes", "categories", "generated_at"]
+    stmt = insert(Report).from_select(columns, source)
+    return stmt.on_conflict_do_update(
+        index_elements=[Report.user_id, Report.week_start],
+        set_={column: stmt.excluded[column] for column in columns[2:]}
+    )
+
+
+def run_chunk(week_start: date, chunk: int):
+    """Compute one planned chunk unless it is done or taken. Returns the reports written (None if skipped)."""
+    db = database.SessionLocal()
+    try:
+        row = db.execute(
+            select(Chunk).where(Chunk.week_start == week_start, Chunk.chunk == chunk, Chunk.done_at.is_(None))
+            .with_for_update(skip_locked=True)
+        ).scalar_one_or_none()
+        if row is None:
+            db.rollback()
+            return None
+        written = db.execute(report_statement(week_start, row.first_user_id, row.end_user_id)).rowcount
+        db.execute(update(Chunk).where(Chunk.week_start == week_start, Chunk.chunk == chunk)
+                   .values(done_at=datetime.utcnow(), reports=written))
+        db.commit()
+        return written
+    finally:
+        db.close()
+
+
+def _run_chunk_star(job):
+    return run_chunk(*job)
+
+
+# --- Run ---
+def run(week_start: date, chunk_users: int = REPORT_CHUNK_USERS, workers: int = REPORT_WORKERS, fresh: bool = False):
+    db = database.SessionLocal()
+    try:
+        if fresh:
+            restart(db, week_start)
+        chunks = plan(db, week_start, chunk_users)
+        pending = db.query(Chunk.chunk).filter(Chunk.week_start == week_start, Chunk.done_at.is_(None)).order_by(Chunk.chunk).all()
+    finally:
+        db.close()
+
+    print(f"Weekly reports for {week_start}: {chunks} chunks, {len(pending)} pending, {workers} workers")
+    jobs = [(week_start, chunk) for (chunk,) in pending]
+    started = time.perf_counter()
+    written = skipped = 0
+    if workers > 1 and len(jobs) > 1:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # spawn, as for the bcrypt pool: each worker opens its own connections
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        results = executor.map(_run_chunk_star, jobs)
+    else:
+        executor = None
+        results = map(_run_chunk_star, jobs)
+    try:
+        for done, reports in enumerate(results, 1):
+            if reports is None:
+                skipped += 1
+            else:
+                written += reports
+            elapsed = time.perf_counter() - started
+            print(f"  chunk {done}/{len(jobs)}  {written:,} reports ({written / elapsed:,.0f}/s), skipped {skipped}")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return written
+
+
+def status(db: Session, week_start: date = None):
+    """(week_start, chunks, done, reports) per planned week, newest first."""
+    query = select(
+        Chunk.week_start,
+        func.count(),
+        func.count(Chunk.done_at),
+        func.coalesce(func.sum(Chunk.reports), 0)
+    ).group_by(Chunk.week_start).order_by(Chunk.week_start.desc())
+    if week_start:
+        query = query.where(Chunk.week_start == week_start)
+    return db.execute(query).all()
+
+
+# --- Reading ---
+def get_report(db: Session, user_id: str, week_start: date = None):
+    """The user's report for the week containing week_start, or their latest one."""
+    query = db.query(Report).filter(Report.user_id == user_id)
+    if week_start:
+        return query.filter(Report.week_start == week_start_of(week_start)).first()
+    return query.order_by(Report.week_start.desc()).first()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.reports", description="Generate weekly focus reports")
+    parser.add_argument("command", choices=["run", "status"])
+    parser.add_argument("--week", type=date.fromisoformat, help="any day of the week (default: last complete week)")
+    parser.add_argument("--chunk-users", type=int, default=REPORT_CHUNK_USERS, help="users per chunk (per transaction)")
+    parser.add_argument("--workers", type=int, default=REPORT_WORKERS, help="worker processes")
+    parser.add_argument("--restart", action="store_true", help="recompute every chunk of the week")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        week_start = week_start_of(args.week) if args.week else last_complete_week()
+        started = time.perf_counter()
+        written = run(week_start, args.chunk_users, args.workers, args.restart)
+        print(f"Wrote {written:,} weekly reports in {time.perf_counter() - started:.1f} s.")
+        return 0
+
+    db = database.SessionLocal()
+    try:
+        rows = status(db, week_start_of(args.week) if args.week else None)
+        for week_start, chunks, done, reports in rows:
+            print(f"{week_start}: {done}/{chunks} chunks done, {reports:,} reports")
+        if not rows:
+            print("No weekly report runs.")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
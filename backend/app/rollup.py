@@ -0,0 +1,227 @@
+"""
+Maintenance of the daily_focus_rollup table.
+
+The crud write functions apply their changes here inside the same transaction as the
+focus_sessions write, and analytics reads only from the rollup. Only COMPLETED
+sessions contribute, matching what the analytics queries used to filter on.
+
+Command line (run from backend/):
+    python -m app.rollup rebuild [--user USER_ID]   # backfill / recompute from focus_sessions
+    python -m app.rollup check [--user USER_ID]     # diff the rollup against focus_sessions
+
+Days whose sessions were archived (partitioning.py) are counted from
+focus_session_archive instead, so rebuilding never loses them.
+
+Every change of a day's session count is passed on to streaks.py, which derives the
+focus streaks from this table; a rebuild recomputes them too.
+"""
+import argparse
+import sys
+from collections import defaultdict
+
+from sqlalchemy import Integer, cast, delete, func, literal, or_, select, union_all
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import models, streaks
+
+Rollup = models.DailyFocusRollup
+Archive = models.FocusSessionArchive
+
+
+def contribution(session):
+    """
+    What a focus session adds to the rollup: (user_id, category_id, day, minutes),
+    or None if it does not count (not COMPLETED).
+    """
+    if session.status != "COMPLETED" or session.start_time is None:
+        return None
+    return (session.user_id, session.category_id, session.start_time.date(), session.duration_minutes or 0)
+
+
+def apply(db: Session, removed=(), added=()):
+    """
+    Subtract the `removed` contributions and add the `added` ones in one upsert, so
+    moving sessions between categories or days costs the same two statements
+    however many sessions move.
+    """
+    totals = defaultdict(lambda: [0, 0])
+    for contributions, sign in ((removed, -1), (added, 1)):
+        for c in contributions:
+            if c is None:
+                continue
+            user_id, category_id, day, minutes = c
+            totals[(user_id, category_id, day)][0] += sign
+            totals[(user_id, category_id, day)][1] += sign * minutes
+    totals = {key: value for key, value in totals.items() if value != [0, 0]}
+    if not totals:
+        return
+
+    stmt = insert(Rollup).values([
+        {"user_id": user_id, "category_id": category_id, "day": day, "session_count": count, "total_minutes": minutes}
+        for (user_id, category_id, day), (count, minutes) in totals.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Rollup.user_id, Rollup.day, Rollup.category_id],
+        set_={
+            "session_count": Rollup.session_count + stmt.excluded.session_count,
+            "total_minutes": Rollup.total_minutes + stmt.excluded.total_minutes,
+        }
+    )
+    db.execute(stmt)
+
+    if any(count < 0 for count, _ in totals.values()):
+        # Drop days that no longer have any sessions so they don't show up as zero rows
+        db.execute(delete(Rollup).where(
+            Rollup.user_id.in_({user_id for user_id, _, _ in totals}),
+            Rollup.day.in_({day for _, _, day in totals}),
+            Rollup.session_count <= 0
+        ))
+    streaks.apply(db, {key: count for key, (count, _) in totals.items() if count})
+
+
+def add(db: Session, contributions):
+    apply(db, added=contributions)
+
+
+def subtract(db: Session, contributions):
+    apply(db, removed=contributions)
+
+
+def _fold_category(db: Session, table, user_id: str, category_id: int, to_category_id: int = None):
+    # One statement: the DELETE ... RETURNING feeds the upsert into the target category
+    moved = delete(table).where(
+        table.user_id == user_id, table.category_id == category_id
+    ).returning(table.user_id, table.day, table.session_count, table.total_minutes).cte("moved")
+    source = select(
+        moved.c.user_id,
+        cast(literal(to_category_id, Integer), Integer).label("category_id"),
+        moved.c.day,
+        moved.c.session_count,
+        moved.c.total_minutes
+    )
+    stmt = insert(table).from_select(
+        ["user_id", "category_id", "day", "session_count", "total_minutes"], source
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.user_id, table.day, table.category_id],
+        set_={
+            "session_count": table.session_count + stmt.excluded.session_count,
+            "total_minutes": table.total_minutes + stmt.excluded.total_minutes,
+        }
+    )
+    db.execute(stmt.add_cte(moved))
+
+
+def move_category(db: Session, user_id: str, category_id: int, to_category_id: int = None):
+    """Fold one user's rollup (and archived) rows of a category into another (or into uncategorized)."""
+    _fold_category(db, Rollup, user_id, category_id, to_category_id)
+    _fold_category(db, Archive, user_id, category_id, to_category_id)
+    streaks.move_category(db, user_id, category_id, to_category_id)
+
+
+def _raw_totals(user_id=None, user_ids=None):
+    """Daily totals computed from focus_sessions plus the archived days (focus_session_archive)."""
+    fs = models.FocusSession
+    day = func.date(fs.start_time)
+    live = select(
+        fs.user_id,
+        fs.category_id,
+        day.label("day"),
+        func.count(fs.id).label("session_count"),
+        func.coalesce(func.sum(fs.duration_minutes), 0).label("total_minutes")
+    ).where(fs.status == "COMPLETED", fs.start_time.is_not(None))
+    archived = select(Archive.user_id, Archive.category_id, Archive.day, Archive.session_count, Archive.total_minutes)
+    if user_id:
+        live = live.where(fs.user_id == user_id)
+        archived = archived.where(Archive.user_id == user_id)
+    if user_ids is not None:
+        live = live.where(fs.user_id.in_(user_ids))
+        archived = archived.where(Archive.user_id.in_(user_ids))
+    live = live.group_by(fs.user_id, fs.category_id, day)
+
+    # A session inserted later with an old start_time can share a day with archived totals
+    combined = union_all(live, archived).subquery("combined")
+    return select(
+        combined.c.user_id,
+        combined.c.category_id,
+        combined.c.day,
+        cast(func.sum(combined.c.session_count), Integer).label("session_count"),
+        cast(func.sum(combined.c.total_minutes), Integer).label("total_minutes")
+    ).group_by(combined.c.user_id, combined.c.category_id, combined.c.day)
+
+
+def rebuild(db: Session, user_id: str = None, user_ids=None):
+    """Recompute the rollup from focus_sessions (all users, one, or a list). Returns the row count."""
+    clear = delete(Rollup)
+    if user_id:
+        clear = clear.where(Rollup.user_id == user_id)
+    if user_ids is not None:
+        clear = clear.where(Rollup.user_id.in_(user_ids))
+    db.execute(clear)
+    result = db.execute(insert(Rollup).from_select(
+        ["user_id", "category_id", "day", "session_count", "total_minutes"], _raw_totals(user_id, user_ids)
+    ))
+    streaks.rebuild(db, user_id, user_ids)
+    return result.rowcount
+
+
+def check(db: Session, user_id: str = None):
+    """
+    Diff the rollup against focus_sessions.
+    Returns a list of (user_id, category_id, day, (raw count, raw minutes), (rollup count, rollup minutes)).
+    """
+    raw = _raw_totals(user_id).subquery("raw")
+    roll = select(Rollup)
+    if user_id:
+        roll = roll.where(Rollup.user_id == user_id)
+    roll = roll.subquery("roll")
+
+    on = (raw.c.user_id == roll.c.user_id) & (raw.c.day == roll.c.day) \
+        & raw.c.category_id.is_not_distinct_from(roll.c.category_id)
+    day = func.coalesce(raw.c.day, roll.c.day)
+    rows = db.execute(select(
+        func.coalesce(raw.c.user_id, roll.c.user_id),
+        func.coalesce(raw.c.category_id, roll.c.category_id),
+        day,
+        raw.c.session_count, raw.c.total_minutes,
+        roll.c.session_count, roll.c.total_minutes
+    ).select_from(
+        raw.join(roll, on, full=True)
+    ).where(or_(
+        raw.c.user_id.is_(None),
+        roll.c.user_id.is_(None),
+        raw.c.session_count != roll.c.session_count,
+        raw.c.total_minutes != roll.c.total_minutes
+    )).order_by(day)).all()
+
+    return [(r[0], r[1], r[2], (r[3] or 0, r[4] or 0), (r[5] or 0, r[6] or 0)) for r in rows]
+
+
+def main(argv=None):
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(prog="python -m app.rollup", description="Maintain daily_focus_rollup")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    parser.add_argument("--user", help="limit to one user id")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        if args.command == "rebuild":
+            rows = rebuild(db, args.user)
+            db.commit()
+            print(f"Rebuilt daily_focus_rollup: {rows} rows.")
+            return 0
+
+        diffs = check(db, args.user)
+        for user_id, category_id, day, raw_totals, rollup_totals in diffs:
+            print(f"{user_id} category={category_id} {day}: sessions {raw_totals} rollup {rollup_totals}")
+        print(f"{len(diffs)} mismatched rows." if diffs else "daily_focus_rollup is consistent with focus_sessions.")
+        return 1 if diffs else 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
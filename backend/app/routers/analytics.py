@@ -1,24 +1,99 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from .. import database, analytics, crud, auth, models
+from datetime import date, datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import database, analytics, auth, models, cache, schemas, serialization, query_budget, reports
 
 router = APIRouter(
     prefix="/analytics",
-    tags=["analytics"]
+    tags=["analytics"],
+    # Identity lookup on a token cache miss + the single dashboard query (0 when cached)
+    dependencies=[Depends(query_budget.budget(2))]
 )
 
+# Opt-in columnar formats (see analytics.get_dashboard_compact); plain JSON stays the default
+DASHBOARD_MEDIA_TYPES = {
+    "json": "application/json",
+    "compact": "application/vnd.flowstate.compact+json",
+    "packed": "application/vnd.flowstate.packed+json",
+}
+
+def _dashboard_format(format, accept):
+    # An explicit ?format= wins over the Accept header
+    if format:
+        return format
+    for name, media_type in DASHBOARD_MEDIA_TYPES.items():
+        if name != "json" and media_type in (accept or ""):
+            return name
+    return "json"
+
 @router.get("/dashboard")
-def get_dashboard_data(category_id: int = None, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    daily_stats = analytics.get_daily_stats(db, str(current_user.id), category_id)
-    weekly_stats = analytics.get_weekly_stats(db, str(current_user.id), category_id)
-    heatmap_data = analytics.get_heatmap_data(db, str(current_user.id), category_id)
-    category_distribution = analytics.get_category_distribution(db, str(current_user.id), category_id)
-    recent_sessions = crud.get_focus_sessions(db, str(current_user.id), limit=5, category_id=category_id)
-    
-    return {
-        "daily_stats": daily_stats,
-        "weekly_stats": weekly_stats,
-        "heatmap_data": heatmap_data,
-        "category_distribution": category_distribution,
-        "recent_sessions": recent_sessions
-    }
+async def get_dashboard_data(
+    request: Request,
+    category_id: int = None,
+    format: str = Query(None, pattern="^(json|compact|packed)$"),
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    variant = _dashboard_format(format, request.headers.get("accept"))
+
+    # Served from the per-user cache until the user writes a session or category (see cache.py)
+    key = cache.dashboard_key(current_user.id, category_id, variant)
+    cached = cache.get(key)
+    if cached:
+        etag, body = cached
+    else:
+        if variant == "json":
+            data = await db.run_sync(analytics.get_dashboard_data, str(current_user.id), category_id)
+        else:
+            data = await db.run_sync(analytics.get_dashboard_compact, str(current_user.id), category_id, variant == "packed")
+        body = serialization.dumps(data)
+        etag = cache.put(key, body)
+
+    headers = {"Cache-Control": "private, no-cache", "Vary": "Accept, Accept-Encoding"}
+    if len(body) >= cache.GZIP_MIN_SIZE and "gzip" in request.headers.get("accept-encoding", ""):
+        etag, body = cache.get_gzipped(key, etag, body)
+        headers["Content-Encoding"] = "gzip"
+    headers["ETag"] = etag
+
+    if cache.etag_matches(request.headers.get("if-none-match"), etag):
+        headers.pop("Content-Encoding", None)
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=DASHBOARD_MEDIA_TYPES[variant], headers=headers)
+
+@router.get("/series", response_model=schemas.AnalyticsSeries)
+async def get_series(
+    start: date = Query(None, alias="from"),
+    end: date = Query(None, alias="to"),
+    granularity: str = Query("day", pattern="^(day|week|month)$"),
+    metric: str = Query("minutes", pattern="^(minutes|count)$"),
+    category_id: int = None,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    # Inclusive UTC dates; defaults to the last 30 days
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=29)
+    if start > end:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+    if analytics.series_points(start, end, granularity) > analytics.SERIES_MAX_POINTS:
+        raise HTTPException(status_code=400, detail=f"Range too long: at most {analytics.SERIES_MAX_POINTS} {granularity}s")
+
+    rows = await db.run_sync(analytics.get_series, str(current_user.id), start, end, granularity, category_id)
+    value = 1 if metric == "count" else 2
+    return serialization.FastJSONResponse({
+        "granularity": granularity,
+        "metric": metric,
+        "points": [{"date": row[0], "value": row[value]} for row in rows],
+    })
+
+@router.get("/weekly-report", response_model=schemas.WeeklyReport)
+async def get_weekly_report(
+    week: date = None,
+    db: AsyncSession = Depends(database.get_async_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    # Precomputed by `python -m app.reports run`; any day of the week, or the latest report
+    report = await db.run_sync(reports.get_report, current_user.id, week)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Weekly report not found")
+    return report
@@ -1,19 +1,36 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from .. import database, schemas, crud, auth, models
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import database, schemas, crud, auth, models, hashing, query_budget
 
-router = APIRouter(tags=["auth"])
+# User lookup, then an insert + refresh on sign-up or a cost upgrade on login
+router = APIRouter(tags=["auth"], dependencies=[Depends(query_budget.budget(4))])
+
+def _hashing_unavailable():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many password checks in progress, please retry",
+        headers={"Retry-After": "1"},
+    )
 
 @router.post("/token", response_model=schemas.Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
-    user = crud.get_user_by_username(db, username=form_data.username)
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(database.get_async_db)):
+    user = await db.run_sync(crud.get_user_by_username, username=form_data.username)
+    valid, new_hash = False, None
+    if user:
+        try:
+            valid, new_hash = await hashing.verify_and_update(form_data.password, user.hashed_password)
+        except hashing.PoolSaturated:
+            raise _hashing_unavailable()
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Stored hash uses a different cost than BCRYPT_ROUNDS: upgrade it now that we know the password
+        await db.run_sync(crud.update_user_password_hash, user=user, hashed_password=new_hash)
     access_token_expires = auth.timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
@@ -21,12 +38,16 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/users/", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
-    db_user = crud.get_user_by_username(db, username=user.username)
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(database.get_async_db)):
+    db_user = await db.run_sync(crud.get_user_by_username, username=user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    return crud.create_user(db=db, user=user)
+    try:
+        hashed_password = await hashing.hash_password(user.password)
+    except hashing.PoolSaturated:
+        raise _hashing_unavailable()
+    return await db.run_sync(crud.create_user, user=user, hashed_password=hashed_password)
 
 @router.get("/users/me/", response_model=schemas.User)
-def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
+async def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
     return current_user
@@ -1,31 +1,46 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from .. import database, schemas, crud, auth, models
+from .. import database, schemas, crud, auth, models, serialization, query_budget
 
 router = APIRouter(
     prefix="/categories",
-    tags=["categories"]
+    tags=["categories"],
+    # Identity lookup + lookup/write/refresh of one category
+    dependencies=[Depends(query_budget.budget(4))]
 )
 
 @router.post("/", response_model=schemas.Category)
-def create_category(category: schemas.CategoryCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    return crud.create_user_category(db=db, category=category, user_id=current_user.id)
+async def create_category(category: schemas.CategoryCreate, db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(auth.get_current_user)):
+    return await db.run_sync(crud.create_user_category, category=category, user_id=current_user.id)
 
 @router.get("/", response_model=List[schemas.Category])
-def read_categories(skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    return crud.get_categories(db, user_id=current_user.id, skip=skip, limit=limit)
+async def read_categories(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(auth.get_current_user)):
+    # Column-projected rows encoded by orjson; skips per-row validation into schemas.Category
+    rows = await db.run_sync(crud.get_category_rows, user_id=current_user.id, skip=skip, limit=limit)
+    return serialization.FastJSONResponse(rows)
 
 @router.put("/{category_id}", response_model=schemas.Category)
-def update_category(category_id: int, category: schemas.CategoryCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    updated_category = crud.update_user_category(db, category_id=category_id, category_update=category, user_id=current_user.id)
+async def update_category(category_id: int, category: schemas.CategoryCreate, db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(auth.get_current_user)):
+    updated_category = await db.run_sync(crud.update_user_category, category_id=category_id, category_update=category, user_id=current_user.id)
     if not updated_category:
         raise HTTPException(status_code=404, detail="Category not found")
     return updated_category
 
-@router.delete("/{category_id}", status_code=204)
-def delete_category(category_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    success = crud.delete_user_category(db, category_id=category_id, user_id=current_user.id)
+# Category lookup + session move (UPDATE, rollup fold + cleanup, streak lock, delete + recompute) + delete + reload of the target
+@router.post("/{category_id}/merge", response_model=schemas.CategoryMergeResult, dependencies=[Depends(query_budget.budget(9))])
+async def merge_category(category_id: int, merge: schemas.CategoryMerge, db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(auth.get_current_user)):
+    # Moves all of category_id's sessions into into_category_id, then deletes category_id
+    merged = await db.run_sync(crud.merge_user_categories, category_id=category_id, into_category_id=merge.into_category_id, user_id=current_user.id)
+    if not merged:
+        raise HTTPException(status_code=404, detail="Category not found")
+    category, moved = merged
+    return {"moved_sessions": moved, "category": category}
+
+# Also detaches the category's sessions, moves their rollup rows and drops the category's streak (under the streak lock)
+@router.delete("/{category_id}", status_code=204, dependencies=[Depends(query_budget.budget(8))])
+async def delete_category(category_id: int, db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(auth.get_current_user)):
+    success = await db.run_sync(crud.delete_user_category, category_id=category_id, user_id=current_user.id)
     if not success:
         raise HTTPException(status_code=404, detail="Category not found")
     return None
@@ -0,0 +1,74 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from datetime import datetime
+from .. import database, schemas, auth, models, live, query_budget
+
+router = APIRouter(
+    prefix="/live",
+    tags=["live"],
+    # Identity lookup, checkpoint read (first request with LIVE_FANOUT=postgres, every one with local),
+    # category check, timer row insert on start, NOTIFY to the other workers
+    dependencies=[Depends(query_budget.budget(5))]
+)
+
+def _state(session):
+    return session.as_dict(datetime.utcnow()) if session is not None else None
+
+@router.get("/", response_model=Optional[schemas.LiveSession])
+async def read_live_session(db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(auth.get_current_user)):
+    return _state(await live.registry.get(db, current_user.id))
+
+@router.post("/start", response_model=schemas.LiveSession)
+async def start_live_session(start: schemas.LiveStart, db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(auth.get_current_user)):
+    try:
+        session = await live.registry.begin(db, current_user.id, category_id=start.category_id, note=start.note, planned_minutes=start.planned_minutes)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Category not found")
+    except live.LiveConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return _state(session)
+
+@router.post("/pause", response_model=schemas.LiveSession)
+async def pause_live_session(db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(auth.get_current_user)):
+    try:
+        return _state(await live.registry.pause(db, current_user.id))
+    except live.LiveConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.post("/resume", response_model=schemas.LiveSession)
+async def resume_live_session(db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(auth.get_current_user)):
+    try:
+        return _state(await live.registry.resume(db, current_user.id))
+    except live.LiveConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+# Timer row delete (RETURNING), category check, insert + rollup upsert, streak lock + upsert, refresh, NOTIFY
+@router.post("/finish", response_model=schemas.FocusSession, dependencies=[Depends(query_budget.budget(10))])
+async def finish_live_session(finish: schemas.LiveFinish, db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(auth.get_current_user)):
+    try:
+        return await live.registry.finish(db, current_user.id, status=finish.status, note=finish.note)
+    except live.LiveConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.post("/stream-ticket", response_model=schemas.StreamTicket)
+async def create_stream_ticket(current_user: models.User = Depends(auth.get_current_user)):
+    return {"ticket": auth.create_stream_ticket(current_user.username), "expires_in": auth.STREAM_TICKET_EXPIRE_SECONDS}
+
+@router.get("/stream")
+async def stream_live_session(db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(auth.get_stream_user)):
+    # Server-Sent Events: `state` events carrying schemas.LiveSession (or null when finished).
+    # Browsers cannot set headers on EventSource: they get a ticket from POST /live/stream-ticket
+    # and open /live/stream?ticket=..., so the long-lived token never appears in a URL.
+    await live.registry.load(db, current_user.id)
+    await db.close()  # an open stream must not hold a pooled connection
+    try:
+        queue = live.registry.subscribe(current_user.id)
+    except live.TooManyStreams as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return StreamingResponse(
+        live.registry.events(current_user.id, queue),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,24 +1,80 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+import math
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from .. import database, schemas, crud, auth, models
+from .. import database, schemas, crud, auth, models, export, serialization, query_budget
 
 router = APIRouter(
     prefix="/sessions",
-    tags=["sessions"]
+    tags=["sessions"],
+    # Identity lookup + insert, rollup upsert, streak lock + upsert (+ recompute of backdated days) and refresh
+    dependencies=[Depends(query_budget.budget(7))]
 )
 
+# A full batch runs a key lookup and an INSERT per BATCH_INSERT_CHUNK items
+BATCH_CHUNKS = math.ceil(schemas.BATCH_MAX_ITEMS / crud.BATCH_INSERT_CHUNK)
+
 @router.post("/", response_model=schemas.FocusSession)
-def create_session(session: schemas.FocusSessionCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    return crud.create_focus_session(db=db, session=session, user_id=current_user.id)
+async def create_session(session: schemas.FocusSessionCreate, db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(auth.get_current_user)):
+    return await db.run_sync(crud.create_focus_session, session=session, user_id=current_user.id)
+
+# Identity lookup, categories, per chunk a key lookup and an insert, lookup of keys stored
+# concurrently, rollup upsert, streak lock + upsert + recompute
+@router.post("/batch", response_model=schemas.FocusSessionBatchResponse,
+             dependencies=[Depends(query_budget.budget(7 + 2 * BATCH_CHUNKS, repeat_limit=BATCH_CHUNKS + 1))])
+async def create_sessions_batch(batch: schemas.FocusSessionBatch, db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(auth.get_current_user)):
+    # Offline clients replay buffered sessions here; per-item results, one transaction
+    results = await db.run_sync(crud.create_focus_sessions_batch, items=batch.items, user_id=current_user.id)
+    return {
+        "created": sum(1 for r in results if r["status"] == "created"),
+        "duplicates": sum(1 for r in results if r["status"] == "duplicate"),
+        "invalid": sum(1 for r in results if r["status"] == "invalid"),
+        "results": results,
+    }
+
+@router.post("/reassign", response_model=schemas.FocusSessionReassignResult)
+async def reassign_sessions(reassign: schemas.FocusSessionReassign, db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(auth.get_current_user)):
+    # Bulk category change: one UPDATE for all ids, one rollup upsert
+    updated = await db.run_sync(crud.reassign_focus_sessions, session_ids=reassign.session_ids, category_id=reassign.category_id, user_id=current_user.id)
+    if updated is None:
+        raise HTTPException(status_code=404, detail="Category not found")
+    return {"updated": updated}
 
 @router.get("/", response_model=List[schemas.FocusSession])
-def read_sessions(skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    return crud.get_focus_sessions(db, user_id=current_user.id, skip=skip, limit=limit)
+async def read_sessions(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(auth.get_current_user)):
+    # Column-projected rows encoded by orjson; skips per-row validation into schemas.FocusSession
+    rows = await db.run_sync(crud.get_focus_session_rows, user_id=current_user.id, skip=skip, limit=limit)
+    return serialization.FastJSONResponse(rows)
+
+@router.get("/page", response_model=schemas.FocusSessionPage)
+async def read_sessions_page(cursor: str = None, limit: int = Query(100, ge=1, le=500), category_id: int = None, db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(auth.get_current_user)):
+    # Cursor-paginated alternative to GET /sessions/?skip=: pass next_cursor back until it is null
+    try:
+        after = crud.decode_session_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    sessions, next_cursor = await db.run_sync(crud.get_focus_sessions_page, user_id=current_user.id, limit=limit, after=after, category_id=category_id)
+    return {"items": sessions, "next_cursor": next_cursor}
+
+@router.get("/export")
+async def export_sessions(format: str = Query("ndjson", pattern="^(ndjson|csv)$"), category_id: int = None, start: datetime = None, end: datetime = None, current_user: models.User = Depends(auth.get_current_user)):
+    # Full history, streamed from a server-side cursor; start/end filter on start_time (UTC, end exclusive).
+    # Normalized here: an offset would only fail once the stream is under way, past the status line.
+    start = crud._utc_naive(start) if start is not None else None
+    end = crud._utc_naive(end) if end is not None else None
+    query = export.export_query(current_user.id, category_id=category_id, start=start, end=end)
+    return StreamingResponse(
+        export.STREAMS[format](query),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="flowstate-sessions.{format}"'},
+    )
 
-@router.put("/{session_id}", response_model=schemas.FocusSession)
-def update_session(session_id: str, session: schemas.FocusSessionUpdate, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    updated_session = crud.update_focus_session(db, session_id=session_id, session_update=session, user_id=current_user.id)
+# Lookup, rollup upsert + empty-row delete, streak lock + upsert + recompute, update, refresh
+@router.put("/{session_id}", response_model=schemas.FocusSession, dependencies=[Depends(query_budget.budget(9))])
+async def update_session(session_id: str, session: schemas.FocusSessionUpdate, db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(auth.get_current_user)):
+    updated_session = await db.run_sync(crud.update_focus_session, session_id=session_id, session_update=session, user_id=current_user.id)
     if not updated_session:
         raise HTTPException(status_code=404, detail="Session not found")
     return updated_session
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import database, schemas, crud, auth, models, serialization, query_budget
+
+router = APIRouter(
+    prefix="/sync",
+    tags=["sync"],
+    # Identity lookup + snapshot xmin, changed categories, tombstones, one page of changed sessions
+    dependencies=[Depends(query_budget.budget(5))]
+)
+
+@router.get("", response_model=schemas.SyncChanges)
+async def read_changes(since: str = None, limit: int = Query(500, ge=1, le=5000), db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(auth.get_current_user)):
+    # Without ?since= this is a full sync; keep the returned token and pass it back as ?since=
+    try:
+        categories, sessions, deleted_categories, deleted_sessions, token, has_more = await db.run_sync(
+            crud.get_changes, user_id=current_user.id, token=since, limit=limit
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    return serialization.FastJSONResponse({
+        "categories": categories,
+        "sessions": sessions,
+        "deleted_categories": deleted_categories,
+        "deleted_sessions": deleted_sessions,
+        "token": token,
+        "has_more": has_more,
+    })
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime
 from uuid import UUID
 
 # --- User Schemas ---
@@ -36,6 +36,13 @@ class Category(CategoryBase):
     class Config:
         from_attributes = True
 
+class CategoryMerge(BaseModel):
+    into_category_id: int # Receives the sessions; the merged category is deleted
+
+class CategoryMergeResult(BaseModel):
+    moved_sessions: int
+    category: Category
+
 # --- Focus Session Schemas ---
 class FocusSessionBase(BaseModel):
     duration_minutes: int
@@ -46,12 +53,42 @@ class FocusSessionBase(BaseModel):
 class FocusSessionCreate(FocusSessionBase):
     pass # start_time is auto-generated, end_time is calculated or passed
 
+class FocusSessionBatchItem(FocusSessionBase):
+    start_time: datetime
+    end_time: datetime
+    idempotency_key: Optional[str] = None # Same key again = same session, never stored twice
+
+BATCH_MAX_ITEMS = 5000
+
+class FocusSessionBatch(BaseModel):
+    items: List[FocusSessionBatchItem] = Field(..., max_length=BATCH_MAX_ITEMS)
+
+class FocusSessionBatchResult(BaseModel):
+    index: int
+    status: str # created / duplicate / invalid
+    id: Optional[UUID] = None
+    duplicate_of: Optional[int] = None # Earlier item in the same batch with the same key
+    error: Optional[str] = None
+
+class FocusSessionBatchResponse(BaseModel):
+    created: int
+    duplicates: int
+    invalid: int
+    results: List[FocusSessionBatchResult]
+
 class FocusSessionUpdate(BaseModel):
     duration_minutes: Optional[int] = None
     status: Optional[str] = None
     note: Optional[str] = None
     category_id: Optional[int] = None
 
+class FocusSessionReassign(BaseModel):
+    session_ids: List[UUID] = Field(..., max_length=5000)
+    category_id: Optional[int] = None # None = uncategorized
+
+class FocusSessionReassignResult(BaseModel):
+    updated: int
+
 class FocusSession(FocusSessionBase):
     id: UUID
     user_id: UUID
@@ -61,10 +98,78 @@ class FocusSession(FocusSessionBase):
     class Config:
         from_attributes = True
 
+class FocusSessionPage(BaseModel):
+    items: List[FocusSession]
+    next_cursor: Optional[str] = None
+
+# --- Analytics Schemas ---
+class SeriesPoint(BaseModel):
+    date: date # First day of the bucket (Monday for weeks)
+    value: int
+
+class AnalyticsSeries(BaseModel):
+    granularity: str
+    metric: str
+    points: List[SeriesPoint] # Every bucket of the range, oldest first; empty ones are 0
+
+class WeeklyReportCategory(BaseModel):
+    category_id: Optional[int] = None # None for uncategorized sessions
+    name: Optional[str] = None
+    color: Optional[str] = None
+    minutes: int
+    sessions: int
+
+class WeeklyReport(BaseModel):
+    week_start: date # Monday
+    total_minutes: int
+    session_count: int
+    minutes_delta: int # Against the week before
+    sessions_delta: int
+    weekday_minutes: List[int] # Monday .. Sunday
+    categories: List[WeeklyReportCategory] # Most minutes first
+    generated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+# --- Sync Schemas ---
+class SyncChanges(BaseModel):
+    categories: List[Category] # Created or changed: replace the local copy
+    sessions: List[FocusSession]
+    deleted_categories: List[int]
+    deleted_sessions: List[UUID]
+    token: str # Pass as ?since= next time (or right away while has_more)
+    has_more: bool
+
+# --- Live Timer Schemas ---
+class LiveStart(BaseModel):
+    category_id: Optional[int] = None
+    note: Optional[str] = Field(None, max_length=2000)
+    planned_minutes: Optional[int] = Field(None, ge=1, le=24 * 60)
+
+class LiveFinish(BaseModel):
+    status: str = Field("COMPLETED", pattern="^(COMPLETED|ABORTED)$")
+    note: Optional[str] = Field(None, max_length=2000) # Replaces the note given at start
+
+class LiveSession(BaseModel):
+    state: str # running / paused
+    category_id: Optional[int] = None
+    note: Optional[str] = None
+    started_at: datetime
+    resumed_at: Optional[datetime] = None
+    elapsed_seconds: int # As of server_time
+    planned_minutes: Optional[int] = None
+    version: int
+    server_time: datetime
+
 # --- Token Schemas ---
 class Token(BaseModel):
     access_token: str
     token_type: str
 
+class StreamTicket(BaseModel):
+    ticket: str
+    expires_in: int
+
 class TokenData(BaseModel):
     username: Optional[str] = None
@@ -0,0 +1,38 @@
+"""
+Fast JSON responses for list endpoints.
+
+Handlers that return FastJSONResponse skip FastAPI's response_model step, which
+validates every row into a Pydantic model before encoding it. Pair it with the
+column-projected *_rows queries in crud.py: plain dicts with exactly the fields of
+the documented schema, encoded by orjson (UUID and datetime are handled natively
+and come out in the same format Pydantic uses). Keep response_model on the route
+so the OpenAPI schema still describes the payload.
+"""
+from uuid import UUID
+
+import orjson
+from fastapi import Response
+
+
+def _default(value):
+    # asyncpg returns its own UUID class, which orjson does not recognise as uuid.UUID
+    if isinstance(value, UUID):
+        return str(value)
+    raise TypeError
+
+
+def dumps(data) -> bytes:
+    return orjson.dumps(data, default=_default)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def rows_as_dicts(result):
+    """Every row of a column-projected SELECT as a dict keyed by column label."""
+    keys = list(result.keys())
+    return [dict(zip(keys, row)) for row in result]
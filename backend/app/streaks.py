@@ -0,0 +1,210 @@
+"""
+Maintenance of the focus_streaks table: runs of consecutive days (UTC) with at least
+one COMPLETED session, per user over all sessions (category_id NULL) and per category.
+
+Streaks are derived from daily_focus_rollup, never from focus_sessions. rollup.apply
+passes every day whose session count it changes, inside the same transaction:
+- a day on or after a streak's last_day can only extend or restart the run ending
+  there, so the usual write (a session finished today) is one upsert for all keys;
+- a backdated day can join two runs and a day losing sessions can split one, so
+  those keys are recomputed with a gaps-and-islands query over the user's rollup days.
+Writes for the same user are serialized with a transaction-level advisory lock taken
+before either, so a recompute never works from rollup days older than a concurrent
+extension it then overwrites.
+The dashboard then reads one row (analytics._dashboard_row).
+
+Command line (run from backend/):
+    python -m app.streaks rebuild [--user USER_ID]   # backfill / recompute from the rollup
+"""
+import argparse
+import sys
+from collections import defaultdict
+
+from sqlalchemy import Integer, Text, and_, case, cast, column, delete, func, literal, or_, select, union_all
+from sqlalchemy.dialects.postgresql import ARRAY, UUID, insert
+from sqlalchemy.orm import Session
+
+from . import models
+
+Rollup = models.DailyFocusRollup
+Streak = models.FocusStreak
+
+COLUMNS = ["user_id", "category_id", "last_day", "current_length", "longest_length", "longest_end"]
+STREAK_LOCK = 0x53747273  # pg_advisory_xact_lock(STREAK_LOCK, hashtext(user_id)): one streak writer per user
+
+
+def _active_days(user_ids=None):
+    """(user_id, category_id, day) for every day with sessions, per category and for all of them (NULL)."""
+    per_category = select(Rollup.user_id, Rollup.category_id, Rollup.day).where(
+        Rollup.category_id.is_not(None), Rollup.session_count > 0
+    )
+    overall = select(
+        Rollup.user_id, cast(literal(None, Integer), Integer).label("category_id"), Rollup.day
+    ).where(Rollup.session_count > 0).group_by(Rollup.user_id, Rollup.day)
+    if user_ids is not None:
+        per_category = per_category.where(Rollup.user_id.in_(user_ids))
+        overall = overall.where(Rollup.user_id.in_(user_ids))
+    return union_all(per_category, overall).subquery("active")
+
+
+def _islands(user_ids=None):
+    """One row per key: last_day, current_length, longest_length, longest_end."""
+    active = _active_days(user_ids)
+    key = (active.c.user_id, active.c.category_id)
+    # Gaps and islands: consecutive days share day - row_number(), so each group is one run
+    numbered = select(
+        active,
+        (active.c.day - cast(func.row_number().over(partition_by=key, order_by=active.c.day), Integer)).label("island")
+    ).subquery("numbered")
+    runs = select(
+        numbered.c.user_id,
+        numbered.c.category_id,
+        func.max(numbered.c.day).label("run_end"),
+        cast(func.count(), Integer).label("length")
+    ).group_by(numbered.c.user_id, numbered.c.category_id, numbered.c.island).subquery("runs")
+    run_key = (runs.c.user_id, runs.c.category_id)
+    ranked = select(
+        runs,
+        func.row_number().over(partition_by=run_key, order_by=runs.c.run_end.desc()).label("latest"),
+        func.row_number().over(partition_by=run_key, order_by=(runs.c.length.desc(), runs.c.run_end.desc())).label("best")
+    ).subquery("ranked")
+    return select(
+        ranked.c.user_id,
+        ranked.c.category_id,
+        func.max(ranked.c.run_end).label("last_day"),
+        func.max(ranked.c.length).filter(ranked.c.latest == 1).label("current_length"),
+        func.max(ranked.c.length).label("longest_length"),
+        func.max(ranked.c.run_end).filter(ranked.c.best == 1).label("longest_end")
+    ).group_by(ranked.c.user_id, ranked.c.category_id)
+
+
+def _lock(db: Session, user_ids):
+    """Wait for the other transactions writing these users' streaks; held until commit. Sorted, so two never deadlock."""
+    ids = cast(literal(sorted({str(user_id) for user_id in user_ids})), ARRAY(Text))
+    ordered = select(func.unnest(ids).label("user_id")).order_by("user_id").subquery("ordered")
+    db.execute(select(func.pg_advisory_xact_lock(STREAK_LOCK, func.hashtext(ordered.c.user_id))))
+
+
+def _upsert(stmt, set_, where=None):
+    return stmt.on_conflict_do_update(index_elements=[Streak.user_id, Streak.category_id], set_=set_, where=where)
+
+
+def _extend(db: Session, days):
+    """
+    Add one new active day per key ({(user_id, category_id): day}) in one upsert.
+    Returns the keys it skipped because the day lies before their last_day.
+    """
+    keys = sorted(days, key=lambda key: (key[0], key[1] is not None, key[1] or 0))
+    stmt = insert(Streak).values([
+        {"user_id": user_id, "category_id": category_id, "last_day": days[(user_id, category_id)],
+         "current_length": 1, "longest_length": 1, "longest_end": days[(user_id, category_id)]}
+        for user_id, category_id in keys
+    ])
+    day = stmt.excluded.last_day
+    current = case(
+        (day == Streak.last_day, Streak.current_length),
+        (day == Streak.last_day + 1, Streak.current_length + 1),
+        else_=1
+    )
+    stmt = _upsert(stmt, {
+        "last_day": day,
+        "current_length": current,
+        "longest_length": func.greatest(Streak.longest_length, current),
+        "longest_end": case((current >= Streak.longest_length, day), else_=Streak.longest_end),
+    }, where=or_(Streak.last_day.is_(None), Streak.last_day <= day))
+    updated = {(str(user_id), category_id) for user_id, category_id in db.execute(stmt.returning(Streak.user_id, Streak.category_id))}
+    return set(keys) - updated
+
+
+def _recompute(db: Session, keys):
+    """Recompute the given (user_id, category_id) keys from the rollup in one upsert; keys with no days get zeros."""
+    keys = sorted(keys, key=lambda key: (key[0], key[1] is not None, key[1] or 0))
+    wanted = func.unnest(
+        cast(literal([user_id for user_id, _ in keys], ARRAY(Text)), ARRAY(UUID(as_uuid=True))),
+        cast(literal([category_id for _, category_id in keys], ARRAY(Integer)), ARRAY(Integer))
+    ).table_valued(column("user_id", UUID(as_uuid=True)), column("category_id", Integer)).render_derived(name="wanted")
+    islands = _islands({user_id for user_id, _ in keys}).subquery("islands")
+    source = select(
+        wanted.c.user_id,
+        wanted.c.category_id,
+        islands.c.last_day,
+        func.coalesce(islands.c.current_length, 0),
+        func.coalesce(islands.c.longest_length, 0),
+        islands.c.longest_end
+    ).select_from(wanted.outerjoin(islands, and_(
+        islands.c.user_id == wanted.c.user_id,
+        islands.c.category_id.is_not_distinct_from(wanted.c.category_id)
+    )))
+    stmt = insert(Streak).from_select(COLUMNS, source)
+    db.execute(_upsert(stmt, {name: stmt.excluded[name] for name in COLUMNS[2:]}))
+
+
+def apply(db: Session, changes):
+    """
+    Bring the streaks up to date after a rollup write. `changes` maps
+    (user_id, category_id, day) to the change of that day's session count.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    for (user_id, category_id, day), count in changes.items():
+        if category_id is not None:
+            deltas[(str(user_id), category_id)][day] += count
+        deltas[(str(user_id), None)][day] += count
+
+    extend, recompute = {}, set()
+    for key, days in deltas.items():
+        days = [(day, count) for day, count in days.items() if count]
+        if not days:
+            continue  # e.g. a session moved between categories on the same day: no change for all sessions
+        if len(days) == 1 and days[0][1] > 0:
+            extend[key] = days[0][0]
+        else:
+            recompute.add(key)
+    if extend or recompute:
+        _lock(db, {user_id for user_id, _ in (*extend, *recompute)})
+    if extend:
+        recompute |= _extend(db, extend)
+    if recompute:
+        _recompute(db, recompute)
+
+
+def move_category(db: Session, user_id: str, category_id: int, to_category_id: int = None):
+    """After rollup.move_category: the moved days join the target category; all-sessions days are unchanged."""
+    _lock(db, [user_id])
+    db.execute(delete(Streak).where(Streak.user_id == user_id, Streak.category_id == category_id))
+    if to_category_id is not None:
+        _recompute(db, {(str(user_id), to_category_id)})
+
+
+def rebuild(db: Session, user_id: str = None, user_ids=None):
+    """Recompute the streaks from the rollup (all users, one, or a list). Returns the row count."""
+    clear = delete(Streak)
+    if user_id:
+        clear = clear.where(Streak.user_id == user_id)
+        user_ids = [user_id]
+    elif user_ids is not None:
+        clear = clear.where(Streak.user_id.in_(user_ids))
+    db.execute(clear)
+    result = db.execute(insert(Streak).from_select(COLUMNS, _islands(user_ids)))
+    return result.rowcount
+
+
+def main(argv=None):
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(prog="python -m app.streaks", description="Maintain focus_streaks")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--user", help="limit to one user id")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        rows = rebuild(db, user_id=args.user)
+        db.commit()
+        print(f"Rebuilt {rows} streak rows.")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
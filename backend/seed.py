@@ -1,20 +1,50 @@
+"""
+開発用のシードデータ。
+
+    python seed.py
+        デモアカウント (demo_user / password123) を作り直します。
+
+    python seed.py --users 10000 --sessions 2000 --years 3 --workers 4
+        負荷検証用の合成データを生成します (synth_user_00000001 ...)。
+        ユーザーごとに固定シードの乱数を使うので、同じ引数・同じ --until なら
+        何度実行しても同じデータになります。ユーザーは --chunk-users 人ずつ
+        1 トランザクションで投入され (セッションは COPY)、投入済みのチャンクは
+        次回の実行でスキップされるため、中断しても同じコマンドで再開できます。
+"""
+import argparse
+import io
 import os
 import sys
-from datetime import datetime, timedelta
+import time
+import uuid
+from datetime import date, datetime, timedelta
 import random
 
 # Ensure the backend directory is in the Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from app.database import SessionLocal, engine
-from app import models, auth
+from sqlalchemy import insert, text
+
+from app.database import SessionLocal
+from app import models, auth, rollup
+
+# ユーザーを参照するテーブル。外部キーに ON DELETE がないため、参照する側から順に削除します。
+# モデルのメタデータから求めるので、テーブルを追加してもここを直す必要はありません。
+USER_TABLES = [
+    table for table in reversed(models.Base.metadata.sorted_tables)
+    if any(fk.column is models.User.__table__.c.id for fk in table.foreign_keys)
+]
+
+def delete_user_rows(db, user_id):
+    """ユーザー本体以外の、そのユーザーの行をすべて削除します。"""
+    for table in USER_TABLES:
+        db.execute(table.delete().where(table.c.user_id == user_id))
 
 def seed_database():
     print("データベースのシード処理を開始します...")
     db = SessionLocal()
     
-    # テーブルが存在しない場合は作成
-    models.Base.metadata.create_all(bind=engine)
+    # テーブルは Alembic で管理 (事前に `alembic upgrade head` を実行してください)
 
     try:
         # demo_user が既に存在するかチェック
@@ -22,8 +52,7 @@ def seed_database():
         
         if existing_demo_user:
             print("既存のデモアカウントデータをクリーンアップしています...")
-            db.query(models.FocusSession).filter(models.FocusSession.user_id == existing_demo_user.id).delete()
-            db.query(models.Category).filter(models.Category.user_id == existing_demo_user.id).delete()
+            delete_user_rows(db, existing_demo_user.id)
             db.delete(existing_demo_user)
             db.commit()
 
@@ -90,6 +119,9 @@ def seed_database():
             )
             db.add(session)
             
+        db.flush()
+        # 集計テーブル(daily_focus_rollup)を再計算
+        rollup.rebuild(db, demo_user.id)
         db.commit()
         print("\n✅ シード処理が完了しました！以下のデモアカウントでログイン可能です：")
         print("  Username: demo_user")
@@ -101,5 +133,188 @@ def seed_database():
     finally:
         db.close()
 
+# --- 合成データ生成 ---
+SYNTH_PREFIX = "synth_user_"
+SYNTH_PASSWORD = "password123"
+CATEGORY_POOL = [
+    ("Work", "#3B82F6"), ("Study", "#10B981"), ("Coding", "#8B5CF6"), ("Reading", "#F59E0B"),
+    ("Writing", "#EF4444"), ("Language", "#EC4899"), ("Design", "#14B8A6"), ("Exercise", "#84CC16"),
+]
+# ポモドーロ (25分) が最多、長めのセッションは少なめ
+DURATIONS = [15, 25, 30, 45, 50, 60, 90]
+DURATION_WEIGHTS = [8, 40, 12, 10, 15, 8, 7]
+# 1日の中の山 (時刻, 標準偏差, 重み): 午前・午後・夜
+TIME_OF_DAY = [(10.0, 1.5, 0.35), (15.0, 2.0, 0.40), (21.0, 1.5, 0.25)]
+NOTES = ["Deep work", "Review", "Reading notes", "Bug fixing", "Exam prep", "Planning"]
+SESSION_COLUMNS = "id, user_id, category_id, start_time, end_time, duration_minutes, status, note"
+COPY_NULL = "\\N"
+
+def synth_username(n):
+    return f"{SYNTH_PREFIX}{n:08d}"
+
+def _timestamp(days, ordinal, seconds):
+    # ordinal 日の 0 時からの経過秒 -> 'YYYY-MM-DD HH:MM:SS' (日付をまたぐ場合も対応)
+    extra_days, seconds = divmod(seconds, 86400)
+    ordinal += extra_days
+    day = days.get(ordinal)
+    if day is None:
+        day = days[ordinal] = date.fromordinal(ordinal).isoformat()
+    hours, rest = divmod(seconds, 3600)
+    return f"{day} {hours:02d}:{rest // 60:02d}:{rest % 60:02d}"
+
+def generate_user(seed, n, sessions, years, until):
+    """
+    1 ユーザー分の合成データ。乱数はユーザー番号ごとに独立しているので、
+    どのチャンク・どのワーカーで生成しても結果は同じです。
+    Returns (user_id, categories [(name, color)], sessions [(id, category index or None, start, end, duration, status, note)])
+    """
+    rng = random.Random(f"{seed}:{n}")
+    user_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+    categories = rng.sample(CATEGORY_POOL, rng.randint(2, 5))
+    category_weights = [rng.random() + 0.2 for _ in categories]
+    category_indexes = list(range(len(categories)))
+
+    last_day = until.toordinal()
+    # 利用開始日はユーザーごとに異なる (長く使っている人ほど履歴が長い)
+    first_day = last_day - rng.randint(min(30, years * 365), years * 365)
+    chronotype = rng.gauss(0, 1.5)  # 朝型 / 夜型
+    weekend_activity = rng.uniform(0.2, 0.8)
+    peaks = [(hour + chronotype, sd) for hour, sd, _ in TIME_OF_DAY]
+    peak_weights = [w for _, _, w in TIME_OF_DAY]
+
+    days = {}
+    rows = []
+    for _ in range(sessions):
+        ordinal = rng.randint(first_day, last_day)
+        # date.fromordinal(1) は月曜日: ordinal % 7 が 6 / 0 なら土日
+        while ordinal % 7 in (6, 0) and rng.random() > weekend_activity:
+            ordinal = rng.randint(first_day, last_day)
+        hour, sd = rng.choices(peaks, peak_weights)[0]
+        start_seconds = int(rng.gauss(hour, sd) * 3600) % 86400  # 0時をまたぐ分は同じ日の未明に折り返す
+        duration = rng.choices(DURATIONS, DURATION_WEIGHTS)[0]
+        if rng.random() < 0.85:
+            status, minutes = "COMPLETED", duration
+        else:
+            status, minutes = "ABORTED", rng.randint(1, duration - 1)
+        rows.append((
+            str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            None if rng.random() < 0.05 else rng.choices(category_indexes, category_weights)[0],
+            _timestamp(days, ordinal, start_seconds),
+            _timestamp(days, ordinal, start_seconds + minutes * 60),
+            duration,
+            status,
+            rng.choice(NOTES) if rng.random() < 0.1 else None,
+        ))
+    return user_id, categories, rows
+
+def load_chunk(seed, first, last, sessions, years, until, hashed_password):
+    """
+    synth ユーザー first..last のうち未投入のものを 1 トランザクションで投入し、
+    投入したセッション数を返します (全員投入済みなら 0)。ユーザーとそのセッションは
+    必ず同じトランザクションで入るので、ユーザー単位でスキップすれば再開できます。
+    """
+    db = SessionLocal()
+    try:
+        wanted = {synth_username(n): n for n in range(first, last + 1)}
+        existing = {name for (name,) in db.query(models.User.username).filter(models.User.username.in_(list(wanted)))}
+        names = [name for name in wanted if name not in existing]
+        if not names:
+            return 0
+
+        generated = [generate_user(seed, wanted[name], sessions, years, until) for name in names]
+        db.execute(insert(models.User), [
+            {"id": user_id, "username": name, "email": f"{name}@example.com", "hashed_password": hashed_password}
+            for name, (user_id, _, _) in zip(names, generated)
+        ])
+        category_ids = db.execute(
+            insert(models.Category).returning(models.Category.id, sort_by_parameter_order=True),
+            [
+                {"name": name, "color_code": color, "user_id": user_id}
+                for user_id, categories, _ in generated for name, color in categories
+            ]
+        ).scalars().all()
+
+        buffer = io.StringIO()
+        position = 0
+        for user_id, categories, rows in generated:
+            ids = category_ids[position:position + len(categories)]
+            position += len(categories)
+            buffer.writelines(
+                f"{session_id}\t{user_id}\t{COPY_NULL if category is None else ids[category]}\t{start}\t{end}\t"
+                f"{duration}\t{status}\t{COPY_NULL if note is None else note}\n"
+                for session_id, category, start, end, duration, status, note in rows
+            )
+        buffer.seek(0)
+        cursor = db.connection().connection.cursor()
+        cursor.copy_expert(f"COPY focus_sessions ({SESSION_COLUMNS}) FROM STDIN", buffer)
+
+        rollup.rebuild(db, user_ids=[user_id for user_id, _, _ in generated])
+        db.commit()
+        return sum(len(rows) for _, _, rows in generated)
+    finally:
+        db.close()
+
+def _load_chunk_star(job):
+    return load_chunk(*job)
+
+def generate_synthetic(users, sessions, years=3, seed=42, chunk_users=100, workers=1, until=None):
+    until = until or datetime.utcnow().date()
+    print(f"合成データを生成します: {users} ユーザー x {sessions} セッション ({years} 年分, seed={seed}, until={until})")
+    # bcrypt は重いので全ユーザー共通のハッシュを 1 回だけ計算
+    hashed_password = auth.get_password_hash(SYNTH_PASSWORD)
+    jobs = [
+        (seed, first, min(first + chunk_users - 1, users), sessions, years, until, hashed_password)
+        for first in range(1, users + 1, chunk_users)
+    ]
+
+    started = time.perf_counter()
+    loaded = skipped = 0
+    if workers > 1:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        results = executor.map(_load_chunk_star, jobs)
+    else:
+        executor = None
+        results = map(_load_chunk_star, jobs)
+    try:
+        for done, rows in enumerate(results, 1):
+            if rows:
+                loaded += rows
+            else:
+                skipped += 1
+            elapsed = time.perf_counter() - started
+            print(f"  チャンク {done}/{len(jobs)}  {loaded:,} セッション投入 ({loaded / elapsed:,.0f} 行/秒), スキップ {skipped}")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    db = SessionLocal()
+    try:
+        db.execute(text("ANALYZE users"))
+        db.execute(text("ANALYZE categories"))
+        db.execute(text("ANALYZE focus_sessions"))
+        db.execute(text("ANALYZE daily_focus_rollup"))
+        db.commit()
+    finally:
+        db.close()
+    print(f"\n✅ 完了: {loaded:,} セッション ({time.perf_counter() - started:.1f} 秒)。ログイン: {synth_username(1)} / {SYNTH_PASSWORD}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, help="合成ユーザー数 (省略時はデモアカウントのみ作成)")
+    parser.add_argument("--sessions", type=int, default=1000, help="ユーザーあたりのセッション数")
+    parser.add_argument("--years", type=int, default=3, help="履歴の期間 (年)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--until", type=date.fromisoformat, help="最新のセッション日 (YYYY-MM-DD, 既定は今日)。再開時は前回と同じ値を指定")
+    parser.add_argument("--chunk-users", type=int, default=100, help="1 トランザクションで投入するユーザー数")
+    parser.add_argument("--workers", type=int, default=1, help="並列に投入するプロセス数")
+    args = parser.parse_args()
+
+    if args.users is None:
+        seed_database()
+    else:
+        generate_synthetic(args.users, args.sessions, args.years, args.seed, args.chunk_users, args.workers, args.until)
+
 if __name__ == "__main__":
-    seed_database()
+    main()
@@ -36,6 +36,10 @@ type DashboardData = {
         note: string;
         category_id: number | null;
     }[];
+    streaks: {
+        current: number; // consecutive days up to today (or yesterday)
+        longest: number;
+    };
 };
 
 export default function DashboardPage() {
@@ -115,7 +119,7 @@ export default function DashboardPage() {
             </div>
 
             {/* Summary Cards */}
-            <div className="grid grid-cols-2 gap-4">
+            <div className="grid grid-cols-2 md:grid-cols-4 gap-4">
                 <div className="bg-white p-6 rounded-xl border border-neutral-200">
                     <div className="text-neutral-500 text-sm">Today's Focus</div>
                     <div className="text-4xl font-bold mt-2 text-indigo-600">
@@ -128,6 +132,18 @@ export default function DashboardPage() {
                         {data.daily_stats.session_count}
                     </div>
                 </div>
+                <div className="bg-white p-6 rounded-xl border border-neutral-200">
+                    <div className="text-neutral-500 text-sm">Current Streak</div>
+                    <div className="text-4xl font-bold mt-2 text-amber-600">
+                        {data.streaks.current} <span className="text-lg text-neutral-400">days</span>
+                    </div>
+                </div>
+                <div className="bg-white p-6 rounded-xl border border-neutral-200">
+                    <div className="text-neutral-500 text-sm">Longest Streak</div>
+                    <div className="text-4xl font-bold mt-2 text-rose-600">
+                        {data.streaks.longest} <span className="text-lg text-neutral-400">days</span>
+                    </div>
+                </div>
             </div>
 
             {/* Heatmap (Contributions) */}